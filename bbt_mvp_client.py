@@ -1,19 +1,26 @@
 #!/usr/bin/env python3
 import asyncio
 import base64
+import functools
 import json
+import logging
 import os
-import secrets
 import time
+from typing import Any
 
 import httpx
 from dotenv import load_dotenv
-from eth_abi.abi import encode
 from eth_account import Account
-from eth_account._utils.signing import sign_message_hash
-from web3 import Web3
+from eth_hash.auto import keccak as _keccak
+from eth_keys import keys
+from eth_utils import to_checksum_address
 
-load_dotenv()
+from logging_utils import get_logger, log_json
+
+if os.getenv("SKIP_DOTENV") != "1":
+    load_dotenv()
+
+logger = get_logger("bbt_mvp_client")
 
 SERVER_URL = os.getenv("SERVER_URL", "http://localhost:8001")
 PRIVATE_KEY = os.getenv("PRIVATE_KEY")
@@ -23,16 +30,18 @@ if RPC_URL and NODE_URL and RPC_URL != NODE_URL:
     raise ValueError("RPC_URL and NODE_URL are both set but differ; set only RPC_URL")
 RPC_URL = RPC_URL or NODE_URL
 
-PERMIT2_ADDRESS = os.getenv(
-    "PERMIT2_ADDRESS", "0x000000000022D473030F116dDEE9F6B43aC78BA3"
+PERMIT2_ADDRESS = to_checksum_address(
+    os.getenv("PERMIT2_ADDRESS", "0x000000000022D473030F116dDEE9F6B43aC78BA3")
 )
 CHAIN_ID = int(os.getenv("CHAIN_ID", "42793"))
 
 # Coinbase x402 vanity address. Not deployed on all chains.
 DEFAULT_X402_EXACT_PERMIT2_PROXY_ADDRESS = "0xB6FD384A0626BfeF85f3dBaf5223Dd964684B09E"
-X402_EXACT_PERMIT2_PROXY_ADDRESS = os.getenv(
-    "X402_EXACT_PERMIT2_PROXY_ADDRESS",
-    DEFAULT_X402_EXACT_PERMIT2_PROXY_ADDRESS,
+X402_EXACT_PERMIT2_PROXY_ADDRESS = to_checksum_address(
+    os.getenv(
+        "X402_EXACT_PERMIT2_PROXY_ADDRESS",
+        DEFAULT_X402_EXACT_PERMIT2_PROXY_ADDRESS,
+    )
 )
 
 if not PRIVATE_KEY:
@@ -42,26 +51,51 @@ if not RPC_URL:
 
 account = Account.from_key(PRIVATE_KEY)
 print(f"Client wallet: {account.address}")
+_SIGNING_KEY = keys.PrivateKey(bytes(account.key))
+
+_EIP712_DOMAIN_TYPEHASH = _keccak(
+    b"EIP712Domain(string name,uint256 chainId,address verifyingContract)"
+)
+_PERMIT2_NAME_HASH = _keccak(b"Permit2")
+_TOKEN_PERMISSIONS_TYPEHASH = _keccak(b"TokenPermissions(address token,uint256 amount)")
+_WITNESS_TYPEHASH = _keccak(b"Witness(address to,uint256 validAfter,bytes extra)")
+# Dependencies must be appended in alphabetical order after the primary type:
+# TokenPermissions < Witness
+_PERMIT_WITNESS_TRANSFER_TYPEHASH = _keccak(
+    b"PermitWitnessTransferFrom(TokenPermissions permitted,address spender,uint256 nonce,uint256 deadline,Witness witness)"
+    b"TokenPermissions(address token,uint256 amount)"
+    b"Witness(address to,uint256 validAfter,bytes extra)"
+)
+
+# keccak256(b""): the witness `extra` field is empty for this client.
+_KECCAK_EMPTY = bytes.fromhex(
+    "c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470"
+)
 
 
-def _permit2_domain_separator(w3: Web3) -> bytes:
-    permit2 = w3.eth.contract(
-        address=Web3.to_checksum_address(PERMIT2_ADDRESS),
-        abi=[
-            {
-                "name": "DOMAIN_SEPARATOR",
-                "type": "function",
-                "stateMutability": "view",
-                "inputs": [],
-                "outputs": [{"name": "", "type": "bytes32"}],
-            }
-        ],
+def _abi_uint256(value: int) -> bytes:
+    return value.to_bytes(32, "big")
+
+
+def _abi_address(address: str) -> bytes:
+    # Every EIP-712 struct field here is a static 32-byte word, so the ABI encoding
+    # is plain left-padded concatenation; no need for eth_abi's generic codec.
+    return bytes.fromhex(address[2:]).rjust(32, b"\x00")
+
+
+@functools.lru_cache(maxsize=4)
+def _permit2_domain_separator(chain_id: int, permit2_address: str) -> bytes:
+    # Permit2 bakes (name, chainId, verifyingContract) into its EIP-712 domain, so the
+    # separator can be derived locally instead of calling DOMAIN_SEPARATOR() over RPC.
+    return _keccak(
+        _EIP712_DOMAIN_TYPEHASH
+        + _PERMIT2_NAME_HASH
+        + _abi_uint256(chain_id)
+        + _abi_address(permit2_address)
     )
-    return permit2.functions.DOMAIN_SEPARATOR().call()
 
 
 def sign_permit2_witness_transfer(
-    w3: Web3,
     token_address: str,
     spender: str,
     amount: int,
@@ -71,64 +105,40 @@ def sign_permit2_witness_transfer(
     valid_after: int,
     extra: bytes,
 ) -> str:
-    """Sign Permit2 PermitWitnessTransferFrom (Coinbase x402 model 3 style)."""
-    domain_separator = _permit2_domain_separator(w3)
+    """Sign Permit2 PermitWitnessTransferFrom (Coinbase x402 model 3 style).
 
-    token_permissions_typehash = Web3.keccak(
-        text="TokenPermissions(address token,uint256 amount)"
-    )
-    witness_typehash = Web3.keccak(text="Witness(address to,uint256 validAfter,bytes extra)")
-
-    # Dependencies must be appended in alphabetical order after the primary type:
-    # TokenPermissions < Witness
-    permit_typehash = Web3.keccak(
-        text=(
-            "PermitWitnessTransferFrom(TokenPermissions permitted,address spender,uint256 nonce,uint256 deadline,Witness witness)"
-            "TokenPermissions(address token,uint256 amount)"
-            "Witness(address to,uint256 validAfter,bytes extra)"
-        )
-    )
+    Addresses are expected to be checksummed by the caller.
+    """
+    domain_separator = _permit2_domain_separator(CHAIN_ID, PERMIT2_ADDRESS)
 
-    token_permissions_hash = Web3.keccak(
-        encode(
-            ["bytes32", "address", "uint256"],
-            [
-                token_permissions_typehash,
-                Web3.to_checksum_address(token_address),
-                amount,
-            ],
-        )
+    token_permissions_hash = _keccak(
+        _TOKEN_PERMISSIONS_TYPEHASH
+        + _abi_address(token_address)
+        + _abi_uint256(amount)
     )
 
-    witness_hash = Web3.keccak(
-        encode(
-            ["bytes32", "address", "uint256", "bytes32"],
-            [
-                witness_typehash,
-                Web3.to_checksum_address(pay_to),
-                valid_after,
-                Web3.keccak(extra),
-            ],
-        )
+    witness_hash = _keccak(
+        _WITNESS_TYPEHASH
+        + _abi_address(pay_to)
+        + _abi_uint256(valid_after)
+        + (_keccak(extra) if extra else _KECCAK_EMPTY)
     )
 
-    struct_hash = Web3.keccak(
-        encode(
-            ["bytes32", "bytes32", "address", "uint256", "uint256", "bytes32"],
-            [
-                permit_typehash,
-                token_permissions_hash,
-                Web3.to_checksum_address(spender),
-                nonce,
-                deadline,
-                witness_hash,
-            ],
-        )
+    struct_hash = _keccak(
+        _PERMIT_WITNESS_TRANSFER_TYPEHASH
+        + token_permissions_hash
+        + _abi_address(spender)
+        + _abi_uint256(nonce)
+        + _abi_uint256(deadline)
+        + witness_hash
     )
 
-    digest = Web3.keccak(b"\x19\x01" + domain_separator + struct_hash)
-    _, _, _, signature = sign_message_hash(account._key_obj, digest)
-    return signature.hex()
+    digest = _keccak(b"\x19\x01" + domain_separator + struct_hash)
+    signature = _SIGNING_KEY.sign_msg_hash(digest)
+    # eth_keys yields v in {0, 1}; Permit2's ecrecover path expects 27/28.
+    return (
+        _abi_uint256(signature.r) + _abi_uint256(signature.s) + bytes((signature.v + 27,))
+    ).hex()
 
 
 def _safe_log_headers(headers: httpx.Headers) -> dict[str, str]:
@@ -150,148 +160,196 @@ def _safe_log_headers(headers: httpx.Headers) -> dict[str, str]:
     return safe
 
 
-async def main():
-    endpoint = f"{SERVER_URL}/api/weather"
-    w3 = Web3(Web3.HTTPProvider(RPC_URL))
-    if not w3.is_connected():
-        raise RuntimeError("RPC not connected")
-    rpc_chain_id = int(w3.eth.chain_id)
+async def _check_rpc(client: httpx.AsyncClient) -> None:
+    # Signing is fully local; the RPC is only used for preflight checks. Send both
+    # reads as a single JSON-RPC batch so they cost one round-trip.
+    batch = [
+        {"jsonrpc": "2.0", "id": 1, "method": "eth_chainId", "params": []},
+        {
+            "jsonrpc": "2.0",
+            "id": 2,
+            "method": "eth_getCode",
+            "params": [PERMIT2_ADDRESS, "latest"],
+        },
+    ]
+    try:
+        resp = await client.post(RPC_URL, json=batch)
+        resp.raise_for_status()
+        body = resp.json()
+    except Exception as exc:
+        raise RuntimeError(f"RPC not connected: {exc}") from exc
+    if not isinstance(body, list):
+        raise RuntimeError(f"RPC returned invalid batch response: {body!r}")
+
+    # Batch responses may come back in any order; match them by id.
+    results: dict[int, Any] = {}
+    for item in body:
+        if not isinstance(item, dict):
+            continue
+        if item.get("error"):
+            raise RuntimeError(f"RPC error in preflight: {item['error']}")
+        results[item.get("id")] = item.get("result")
+
+    try:
+        rpc_chain_id = int(results.get(1), 16)
+    except (TypeError, ValueError) as exc:
+        raise RuntimeError(f"RPC returned invalid eth_chainId: {results.get(1)!r}") from exc
     if rpc_chain_id != CHAIN_ID:
         raise RuntimeError(
             f"CHAIN_ID mismatch: configured {CHAIN_ID}, RPC reports {rpc_chain_id}"
         )
-    if not w3.eth.get_code(Web3.to_checksum_address(PERMIT2_ADDRESS)):
+    code = results.get(2)
+    if not isinstance(code, str) or code in ("0x", "0x0"):
         raise RuntimeError(f"No code deployed at PERMIT2_ADDRESS={PERMIT2_ADDRESS}")
 
-    print("=" * 60)
-    print("STEP 1: Request without payment (expect 402)")
-    print("=" * 60)
 
+async def main():
+    endpoint = f"{SERVER_URL}/api/weather"
+
+    # One client for both the unpaid probe and the paid request so the second call
+    # reuses the already-open connection.
     async with httpx.AsyncClient(timeout=60.0) as client:
-        resp = await client.get(endpoint)
+        print("=" * 60)
+        print("STEP 1: Request without payment (expect 402)")
+        print("=" * 60)
+
+        # The RPC preflight does not depend on the 402 response; overlap the two
+        # round-trips instead of running them back to back. If the preflight fails,
+        # stop the probe before the client closes and collect its outcome.
+        probe = asyncio.create_task(client.get(endpoint))
+        try:
+            await _check_rpc(client)
+        except BaseException:
+            probe.cancel()
+            await asyncio.gather(probe, return_exceptions=True)
+            raise
+        resp = await probe
         print(f"Status: {resp.status_code}")
-        print(f"Headers: {_safe_log_headers(resp.headers)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Headers: %s", _safe_log_headers(resp.headers))
 
         if resp.status_code != 402:
             print(f"Expected 402, got {resp.status_code}")
             print(f"Body: {resp.text}")
             return
 
-        payment_required_b64 = resp.headers.get("Payment-Required") or resp.headers.get(
-            "payment-required"
-        )
+        # httpx header lookups are case-insensitive.
+        payment_required_b64 = resp.headers.get("Payment-Required")
         if not payment_required_b64:
             print("No Payment-Required header!")
             return
 
         payment_required = json.loads(base64.b64decode(payment_required_b64))
-        print("\nDecoded Payment-Required:")
-        print(json.dumps(payment_required, indent=2))
-
-    print("\n" + "=" * 60)
-    print("STEP 2: Create Permit2 (PermitWitnessTransferFrom) payment payload")
-    print("=" * 60)
-
-    accept = payment_required["accepts"][0]
-    extra = accept.get("extra") or {}
-    asset_transfer_method = extra.get("assetTransferMethod")
-    if asset_transfer_method and asset_transfer_method != "permit2":
-        raise RuntimeError(
-            f"Unsupported assetTransferMethod={asset_transfer_method!r}; this Beta client only supports 'permit2'."
-        )
-    asset = accept["asset"]
-    pay_to = Web3.to_checksum_address(accept["payTo"])
-    amount_raw = accept.get("amount") or accept.get("maxAmountRequired")
-    max_amount = int(amount_raw)
-
-    token_address = Web3.to_checksum_address(asset)
-    spender = Web3.to_checksum_address(X402_EXACT_PERMIT2_PROXY_ADDRESS)
-
-    max_timeout_raw = accept.get("maxTimeoutSeconds")
-    try:
-        max_timeout_seconds = int(max_timeout_raw) if max_timeout_raw is not None else 60
-    except (TypeError, ValueError) as exc:
-        raise RuntimeError(f"Invalid maxTimeoutSeconds in requirements: {max_timeout_raw!r}") from exc
-    if max_timeout_seconds <= 0:
-        raise RuntimeError(
-            f"Invalid maxTimeoutSeconds in requirements: {max_timeout_seconds}"
-        )
-
-    now = int(time.time())
-    deadline = now + max_timeout_seconds
-    valid_after = now
-    nonce = secrets.randbits(256)
-    extra = b""  # "0x"
-
-    print(f"Token: {token_address}")
-    print(f"Pay to (witness.to): {pay_to}")
-    print(f"Amount: {max_amount}")
-    print(f"maxTimeoutSeconds: {max_timeout_seconds}")
-    print(f"Chain ID: {CHAIN_ID}")
-    print(f"Permit2 proxy spender: {spender}")
-    if spender.lower() == DEFAULT_X402_EXACT_PERMIT2_PROXY_ADDRESS.lower():
-        print(
-            "NOTE: Using default Etherlink proxy address. Override via "
-            "X402_EXACT_PERMIT2_PROXY_ADDRESS if needed."
+        log_json(logger, logging.DEBUG, "Decoded Payment-Required", payment_required)
+
+        print("\n" + "=" * 60)
+        print("STEP 2: Create Permit2 (PermitWitnessTransferFrom) payment payload")
+        print("=" * 60)
+
+        accept = payment_required["accepts"][0]
+        extra = accept.get("extra") or {}
+        asset_transfer_method = extra.get("assetTransferMethod")
+        if asset_transfer_method and asset_transfer_method != "permit2":
+            raise RuntimeError(
+                f"Unsupported assetTransferMethod={asset_transfer_method!r}; this Beta client only supports 'permit2'."
+            )
+        asset = accept["asset"]
+        pay_to = to_checksum_address(accept["payTo"])
+        amount_raw = accept.get("amount") or accept.get("maxAmountRequired")
+        max_amount = int(amount_raw)
+
+        token_address = to_checksum_address(asset)
+        spender = X402_EXACT_PERMIT2_PROXY_ADDRESS
+
+        max_timeout_raw = accept.get("maxTimeoutSeconds")
+        try:
+            max_timeout_seconds = int(max_timeout_raw) if max_timeout_raw is not None else 60
+        except (TypeError, ValueError) as exc:
+            raise RuntimeError(f"Invalid maxTimeoutSeconds in requirements: {max_timeout_raw!r}") from exc
+        if max_timeout_seconds <= 0:
+            raise RuntimeError(
+                f"Invalid maxTimeoutSeconds in requirements: {max_timeout_seconds}"
+            )
+
+        now = int(time.time())
+        deadline = now + max_timeout_seconds
+        valid_after = now
+        # SignatureTransfer nonces are unordered (bitmap-based), so a random 256-bit
+        # value is valid without reading any nonce state from Permit2.
+        nonce = int.from_bytes(os.urandom(32), "big")
+        extra = b""  # "0x"
+
+        print(f"Token: {token_address}")
+        print(f"Pay to (witness.to): {pay_to}")
+        print(f"Amount: {max_amount}")
+        print(f"maxTimeoutSeconds: {max_timeout_seconds}")
+        print(f"Chain ID: {CHAIN_ID}")
+        print(f"Permit2 proxy spender: {spender}")
+        if spender.lower() == DEFAULT_X402_EXACT_PERMIT2_PROXY_ADDRESS.lower():
+            print(
+                "NOTE: Using default Etherlink proxy address. Override via "
+                "X402_EXACT_PERMIT2_PROXY_ADDRESS if needed."
+            )
+        print(f"Nonce: {nonce}")
+        print(f"Deadline: {deadline}")
+
+        # Keccak + secp256k1 work is CPU-bound; keep it off the event loop.
+        signature = await asyncio.to_thread(
+            sign_permit2_witness_transfer,
+            token_address=token_address,
+            spender=spender,
+            amount=max_amount,
+            nonce=nonce,
+            deadline=deadline,
+            pay_to=pay_to,
+            valid_after=valid_after,
+            extra=extra,
         )
-    print(f"Nonce: {nonce}")
-    print(f"Deadline: {deadline}")
-
-    signature = sign_permit2_witness_transfer(
-        w3=w3,
-        token_address=token_address,
-        spender=spender,
-        amount=max_amount,
-        nonce=nonce,
-        deadline=deadline,
-        pay_to=pay_to,
-        valid_after=valid_after,
-        extra=extra,
-    )
 
-    payment_payload = {
-        "x402Version": 2,
-        "accepted": accept,
-        "resource": payment_required.get("resource"),
-        "payload": {
-            "signature": f"0x{signature}",
-            "permit2Authorization": {
-                "from": account.address,
-                "permitted": {"token": token_address, "amount": str(max_amount)},
-                "spender": spender,
-                "nonce": str(nonce),
-                "deadline": str(deadline),
-                "witness": {
-                    "to": pay_to,
-                    "validAfter": str(valid_after),
-                    "extra": "0x",
+        payment_payload = {
+            "x402Version": 2,
+            "accepted": accept,
+            "resource": payment_required.get("resource"),
+            "payload": {
+                "signature": f"0x{signature}",
+                "permit2Authorization": {
+                    "from": account.address,
+                    "permitted": {"token": token_address, "amount": str(max_amount)},
+                    "spender": spender,
+                    "nonce": str(nonce),
+                    "deadline": str(deadline),
+                    "witness": {
+                        "to": pay_to,
+                        "validAfter": str(valid_after),
+                        "extra": "0x",
+                    },
                 },
             },
-        },
-    }
-
-    payment_header = base64.b64encode(json.dumps(payment_payload).encode()).decode()
-    print("\nPayment payload prepared (redacted):")
-    print(
-        json.dumps(
-            {
-                "x402Version": payment_payload["x402Version"],
-                "accepted": payment_payload["accepted"],
-                "payload": {
-                    "permit2Authorization": payment_payload["payload"]["permit2Authorization"],
-                    "signature": "[REDACTED]",
+        }
+
+        payment_header = base64.b64encode(
+            json.dumps(payment_payload, separators=(",", ":")).encode("ascii")
+        ).decode("ascii")
+        print("\nPayment payload prepared (redacted):")
+        print(
+            json.dumps(
+                {
+                    "x402Version": payment_payload["x402Version"],
+                    "accepted": payment_payload["accepted"],
+                    "payload": {
+                        "permit2Authorization": payment_payload["payload"]["permit2Authorization"],
+                        "signature": "[REDACTED]",
+                    },
+                    "paymentSignatureLength": len(payment_header),
                 },
-                "paymentSignatureLength": len(payment_header),
-            },
-            indent=2,
+                indent=2,
+            )
         )
-    )
 
-    print("\n" + "=" * 60)
-    print("STEP 3: Send request WITH payment")
-    print("=" * 60)
+        print("\n" + "=" * 60)
+        print("STEP 3: Send request WITH payment")
+        print("=" * 60)
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
         resp = await client.get(
             endpoint,
             headers={
@@ -299,7 +357,8 @@ async def main():
             },
         )
         print(f"Status: {resp.status_code}")
-        print(f"Headers: {_safe_log_headers(resp.headers)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Headers: %s", _safe_log_headers(resp.headers))
         print("\nResponse body:")
         try:
             print(json.dumps(resp.json(), indent=2))
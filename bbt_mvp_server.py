@@ -1,27 +1,54 @@
 #!/usr/bin/env python3
-import base64
-import copy
+import asyncio
+import binascii
+import bisect
+import contextlib
+import functools
+import gzip
+import hashlib
+import heapq
+import ipaddress
 import json
 import logging
 import os
 import re
 import time
 import uuid
+from collections import deque
+from dataclasses import dataclass, field
 from decimal import Decimal
-from typing import Any
+from typing import Any, NamedTuple
 
 import httpx
-from eth_account.messages import encode_defunct
+import msgspec
+import orjson
+from eth_account import Account
+from eth_hash.auto import keccak as _keccak
+from eth_keys import keys
 from fastapi import FastAPI, Request, Response
 from dotenv import load_dotenv
-from web3 import Web3
 
 from logging_utils import get_logger, log_json
 
-load_dotenv()
+if os.getenv("SKIP_DOTENV") != "1":
+    load_dotenv()
+
+
+def _new_http_client() -> httpx.AsyncClient:
+    # Shared by facilitator /settle and RPC calls. Explicit pool limits keep connections
+    # to those two upstreams warm under concurrency; HTTP/2 is negotiated via ALPN on https.
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(120.0, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=512,
+            max_keepalive_connections=256,
+            keepalive_expiry=60.0,
+        ),
+        http2=True,
+    )
+
 
-app = FastAPI()
-http_client = httpx.AsyncClient(timeout=120.0)
+http_client = _new_http_client()
 logger = get_logger("bbt_mvp_server")
 
 
@@ -32,8 +59,61 @@ def _env_bool(name: str, default: bool) -> bool:
     return raw.strip().lower() in {"1", "true", "yes", "on"}
 
 
+def _bounded_cache_put(cache: dict[Any, Any], key: Any, value: Any, max_size: int) -> None:
+    # Several caches are keyed by client-controlled values (Host header, token address);
+    # dicts keep insertion order, so evicting the first key drops the oldest entry.
+    if len(cache) >= max_size:
+        cache.pop(next(iter(cache)))
+    cache[key] = value
+
+
+def _json_bytes(payload: Any) -> bytes:
+    try:
+        return orjson.dumps(payload)
+    except TypeError:
+        # orjson rejects integers wider than 64 bits, which can appear in echoed
+        # client or facilitator payloads; fall back to the stdlib encoder for those.
+        return json.dumps(payload).encode()
+
+
+# Outbound JSON bodies are pre-encoded with _json_bytes rather than httpx's json=,
+# which would run the stdlib encoder.
+JSON_REQUEST_HEADERS = {"Content-Type": "application/json"}
+
+
+class JSONBytesResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return _json_bytes(content)
+
+
+def _error_response(status_code: int, message: str) -> Response:
+    return JSONBytesResponse({"error": message}, status_code=status_code)
+
+
+@contextlib.asynccontextmanager
+async def _lifespan(app: FastAPI):
+    global http_client
+    # Shutdown closes the client, so a later startup in the same process needs a new one.
+    if http_client.is_closed:
+        http_client = _new_http_client()
+    cleanup_task = asyncio.create_task(_periodic_cleanup()) if CUSTOM_PRODUCTS_ENABLED else None
+    try:
+        yield
+    finally:
+        if cleanup_task is not None:
+            cleanup_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await cleanup_task
+        await http_client.aclose()
+
+
+app = FastAPI(default_response_class=JSONBytesResponse, lifespan=_lifespan)
+
+
 FACILITATOR_URL = os.getenv("FACILITATOR_URL", "http://localhost:9090")
-PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").strip()
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").strip().rstrip("/")
 SERVER_WALLET_ENV = os.getenv("SERVER_WALLET")
 STORE_ADDRESS_ENV = os.getenv("STORE_ADDRESS")
 STORE_PRIVATE_KEY_ENV = os.getenv("STORE_PRIVATE_KEY")
@@ -65,9 +145,23 @@ CUSTOM_PRODUCT_TIERS: dict[str, dict[str, str]] = {
     "tier_0_1": {"label": "0.1", "amount": "0.1"},
     "tier_1_0": {"label": "1.0", "amount": "1.0"},
 }
+CUSTOM_PRODUCT_TIER_AMOUNTS: dict[str, Decimal] = {
+    tier_id: Decimal(tier["amount"]) for tier_id, tier in CUSTOM_PRODUCT_TIERS.items()
+}
+
+EIP155_NETWORK_RE = re.compile(r"eip155:(\d+)")
+PERSONAL_SIGNATURE_RE = re.compile(r"0x[0-9a-fA-F]{130}")
+PERMIT2_SIGNATURE_RE = re.compile(r"0x(?:[0-9a-fA-F]{2})+")
+# The 0x prefix is optional (either case), matching what web3's address helpers accept.
+HEX_ADDRESS_RE = re.compile(r"(?:0[xX])?([0-9a-fA-F]{40})")
+IPV4_MAPPED_PREFIX = bytes(10) + b"\xff\xff"
+NON_PRINTABLE_ASCII_BYTES = bytes(b for b in range(256) if not 32 <= b <= 126)
 
 CREATE_RATE_WINDOW_SECONDS = 3600
 CUSTOM_CREATE_CLOCK_SKEW_SECONDS = 60
+CUSTOM_STATE_CLEANUP_INTERVAL_SECONDS = 60
+# A legitimate create payload is well under 1 KiB.
+CUSTOM_CREATE_MAX_BODY_BYTES = 4096
 
 
 def _resolve_server_wallet() -> str:
@@ -76,15 +170,31 @@ def _resolve_server_wallet() -> str:
     if STORE_ADDRESS_ENV:
         return STORE_ADDRESS_ENV
     if STORE_PRIVATE_KEY_ENV:
-        return Web3().eth.account.from_key(STORE_PRIVATE_KEY_ENV).address
+        return Account.from_key(STORE_PRIVATE_KEY_ENV).address
     raise RuntimeError(
         "Missing payout wallet config: set SERVER_WALLET, STORE_ADDRESS, or STORE_PRIVATE_KEY"
     )
 
 
+@functools.lru_cache(maxsize=4096)
+def _checksum_lower(raw_lower: str) -> str:
+    # EIP-55 hashes the address; the same handful of payer/token/proxy addresses
+    # show up on every request, so memoize on the case-folded form. Done directly on
+    # the keccak digest rather than through web3's layered input normalization.
+    match = HEX_ADDRESS_RE.fullmatch(raw_lower)
+    if not match:
+        raise ValueError(f"not a hex address: {raw_lower!r}")
+    hex_address = match.group(1)
+    digest = _keccak(hex_address.encode("ascii")).hex()
+    return "0x" + "".join(
+        char.upper() if nibble in "89abcdef" else char
+        for char, nibble in zip(hex_address, digest)
+    )
+
+
 def _to_checksum(raw: str, field_name: str) -> str:
     try:
-        return Web3.to_checksum_address(raw)
+        return _checksum_lower(raw.lower())
     except Exception as exc:
         raise RuntimeError(f"Invalid {field_name}: {raw}") from exc
 
@@ -93,11 +203,16 @@ def _same_address(a: str, b: str) -> bool:
     return str(a).lower() == str(b).lower()
 
 
+def _address_key(address: str) -> bytes:
+    # Case-insensitive, compact dict key for an already validated 0x address.
+    return bytes.fromhex(address[2:])
+
+
 def _to_checksum_strict(raw: Any, field_name: str) -> str:
     if not isinstance(raw, str):
         raise RuntimeError(f"Invalid {field_name}: must be a string")
     address = _to_checksum(raw, field_name)
-    if not Web3.is_checksum_address(raw):
+    if raw != address:
         raise RuntimeError(f"Invalid {field_name}: must be checksum address")
     return address
 
@@ -107,7 +222,9 @@ BBT_TOKEN = _to_checksum(BBT_TOKEN, "BBT_TOKEN")
 X402_EXACT_PERMIT2_PROXY_ADDRESS = _to_checksum(
     X402_EXACT_PERMIT2_PROXY_ADDRESS, "X402_EXACT_PERMIT2_PROXY_ADDRESS"
 )
-network_match = re.match(r"^eip155:(\d+)$", NETWORK)
+# Lowered once; every paid request compares the signed spender against it.
+X402_EXACT_PERMIT2_PROXY_ADDRESS_LOWER = X402_EXACT_PERMIT2_PROXY_ADDRESS.lower()
+network_match = EIP155_NETWORK_RE.fullmatch(NETWORK)
 if not network_match:
     raise RuntimeError(
         f"Invalid NETWORK value: {NETWORK!r}. Expected format eip155:<chainId>"
@@ -128,10 +245,37 @@ if CUSTOM_PRODUCT_CREATE_MAX_PER_IP_PER_HOUR <= 0:
 if CUSTOM_PRODUCT_SIGNATURE_MAX_AGE_SECONDS <= 0:
     raise RuntimeError("CUSTOM_PRODUCT_SIGNATURE_MAX_AGE_SECONDS must be > 0")
 
-CUSTOM_PRODUCTS_BY_ID: dict[str, dict[str, Any]] = {}
-CUSTOM_PRODUCTS_BY_CREATOR: dict[str, set[str]] = {}
-USED_CREATE_NONCES: dict[str, dict[str, int]] = {}
-CREATE_RATE_LIMIT_BY_IP: dict[str, list[int]] = {}
+CUSTOM_PRODUCTS_BY_ID: dict[str, "Product"] = {}
+# Creator keys are the raw 20-byte address (see _address_key); product ids are kept
+# sorted on insert so the catalog can list them without re-sorting.
+CUSTOM_PRODUCTS_BY_CREATOR: dict[bytes, list[str]] = {}
+# (expiresAt, product_id) min-heap so TTL sweeps only touch products that have expired.
+CUSTOM_PRODUCT_EXPIRY_HEAP: list[tuple[int, str]] = []
+# (creator_key, nonce) -> expiresAt, swept through the matching min-heap.
+USED_CREATE_NONCES: dict[tuple[bytes, str], int] = {}
+USED_CREATE_NONCE_EXPIRY_HEAP: list[tuple[int, tuple[bytes, str]]] = []
+CREATE_NONCES_IN_FLIGHT: set[tuple[bytes, str]] = set()
+CREATE_RATE_LIMIT_BY_IP: dict[bytes, deque[int]] = {}
+_last_cleanup_ts = 0
+PAYMENT_REQUIRED_HEADER_CACHE: dict[tuple[str, str], str] = {}
+PAYMENT_REQUIRED_HEADER_CACHE_MAX = 1024
+# Static 402 body; the product-specific terms travel in the Payment-Required header.
+PAYMENT_REQUIRED_BODY = _json_bytes(
+    {
+        "error": "Payment Required",
+        "message": "Send Payment-Signature header",
+    }
+)
+CATALOG_RESPONSE_CACHE: dict[str, tuple[bytes, bytes | None, str]] = {}
+CATALOG_RESPONSE_CACHE_MAX = 1024
+# Below roughly one MTU, gzip framing and the client-side inflate cost more than they save.
+CATALOG_GZIP_MIN_BYTES = 1024
+# decimals()/symbol() are immutable per contract, so resolved metadata is kept per token.
+TOKEN_METADATA_CACHE: dict[str, tuple[int, str]] = {}
+TOKEN_METADATA_CACHE_MAX = 1024
+TOKEN_METADATA_LOCKS: dict[str, asyncio.Lock] = {}
+# Tasks holding or queued on each lock; a lock is dropped only once nobody uses it.
+TOKEN_METADATA_LOCK_USERS: dict[str, int] = {}
 
 def _payment_requirements(amount_wei: str) -> dict[str, Any]:
     return {
@@ -147,31 +291,100 @@ def _payment_requirements(amount_wei: str) -> dict[str, Any]:
     }
 
 
-PRODUCTS: dict[str, dict[str, Any]] = {
-    "weather": {
-        "id": "weather",
-        "name": "Weather Snapshot",
-        "path": "/api/weather",
-        "description": "Weather data access",
-        "requirements": _payment_requirements("10000000000000000"),
-        "response": {
+REQUIREMENTS_CRITICAL_KEYS = (
+    "scheme",
+    "network",
+    "amount",
+    "payTo",
+    "maxTimeoutSeconds",
+    "asset",
+)
+
+
+def _requirements_key(requirements: dict[str, Any]) -> tuple[Any, ...]:
+    # Canonical form compared by _requirements_match; products store theirs at build time.
+    return (
+        *(str(requirements.get(key)) for key in REQUIREMENTS_CRITICAL_KEYS),
+        requirements.get("extra"),
+    )
+
+
+@dataclass(slots=True)
+class Product:
+    id: str
+    name: str
+    path: str
+    description: str
+    requirements: dict[str, Any]
+    response: dict[str, Any]
+    # Custom token products only.
+    creator: str | None = None
+    tier_id: str | None = None
+    expires_at: int | None = None
+    created_at: int | None = None
+    # Derived once at build time for the paid path and the catalog.
+    requirements_key: tuple[Any, ...] = field(init=False)
+    catalog_entry: dict[str, Any] = field(init=False)
+    required_amount: int = field(init=False)
+    max_timeout_seconds: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.requirements_key = _requirements_key(self.requirements)
+        self.catalog_entry = _catalog_entry(self)
+        self.required_amount = int(self.requirements.get("amount", "0"))
+        self.max_timeout_seconds = int(self.requirements.get("maxTimeoutSeconds", "0") or 0)
+
+
+def _catalog_entry(product: Product) -> dict[str, Any]:
+    # Request-independent catalog fields; _catalog_product fills in `url` per request.
+    requirements = product.requirements
+    catalog_entry = {
+        "id": product.id,
+        "name": product.name,
+        "path": product.path,
+        "url": None,
+        "description": product.description,
+        "payment": {
+            "x402Version": 2,
+            "scheme": requirements["scheme"],
+            "network": requirements["network"],
+            "amount": requirements["amount"],
+            "payTo": requirements["payTo"],
+            "asset": requirements["asset"],
+            "maxTimeoutSeconds": requirements["maxTimeoutSeconds"],
+            "extra": requirements.get("extra"),
+        },
+    }
+    if product.expires_at is not None:
+        catalog_entry["expiresAt"] = product.expires_at
+    return catalog_entry
+
+
+PRODUCTS: dict[str, Product] = {
+    "weather": Product(
+        id="weather",
+        name="Weather Snapshot",
+        path="/api/weather",
+        description="Weather data access",
+        requirements=_payment_requirements("10000000000000000"),
+        response={
             "weather": "sunny",
             "temperature": 25,
             "location": "Etherlink",
         },
-    },
-    "premium-content": {
-        "id": "premium-content",
-        "name": "Premium Content",
-        "path": "/api/premium-content",
-        "description": "Premium content access",
-        "requirements": _payment_requirements("50000000000000000"),
-        "response": {
+    ),
+    "premium-content": Product(
+        id="premium-content",
+        name="Premium Content",
+        path="/api/premium-content",
+        description="Premium content access",
+        requirements=_payment_requirements("50000000000000000"),
+        response={
             "content": "Premium x402 content unlocked",
             "tier": "premium",
             "location": "Etherlink",
         },
-    },
+    ),
 }
 
 DEFAULT_PRODUCT_ID = "weather"
@@ -198,8 +411,13 @@ def _public_base_from_headers(request: Request) -> str:
 def _resource_url(request: Request, path: str) -> str:
     normalized_path = path if path.startswith("/") else f"/{path}"
     if PUBLIC_BASE_URL:
-        return f"{PUBLIC_BASE_URL.rstrip('/')}" + normalized_path
-    return f"{_public_base_from_headers(request)}" + normalized_path
+        return PUBLIC_BASE_URL + normalized_path
+    # Catalog responses resolve one URL per product; parse the forwarding headers once.
+    public_base = getattr(request.state, "public_base", None)
+    if public_base is None:
+        public_base = _public_base_from_headers(request)
+        request.state.public_base = public_base
+    return public_base + normalized_path
 
 
 def _explorer_url(tx_hash: str | None) -> str | None:
@@ -218,60 +436,92 @@ def _client_ip(request: Request) -> str:
     return "unknown"
 
 
+def _client_ip_key(request: Request) -> bytes:
+    # 16-byte rate-limit key: IPv4 is folded into its IPv4-mapped IPv6 form. A trailing
+    # ":port" or "[v6]:port" wrapper from a proxy is stripped first; anything that still
+    # does not parse keeps its own bucket keyed by the raw string.
+    raw = _client_ip(request)
+    host = raw
+    if host.startswith("["):
+        host = host[1:].partition("]")[0]
+    elif host.count(":") == 1:
+        host = host.partition(":")[0]
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return b"s:" + raw.encode("utf-8", "surrogateescape")
+    if address.version == 4:
+        return IPV4_MAPPED_PREFIX + address.packed
+    return address.packed
+
+
+def _expire_rate_window(timestamps: deque[int], cutoff: int) -> None:
+    # Timestamps are appended in arrival order, so expired entries are always at the head.
+    while timestamps and timestamps[0] <= cutoff:
+        timestamps.popleft()
+
+
 def _cleanup_custom_state(now: int | None = None) -> None:
+    global _last_cleanup_ts
     now_ts = int(time.time()) if now is None else now
-
-    expired_product_ids = [
-        product_id
-        for product_id, product in CUSTOM_PRODUCTS_BY_ID.items()
-        if int(product.get("expiresAt", 0) or 0) <= now_ts
-    ]
-    for product_id in expired_product_ids:
-        product = CUSTOM_PRODUCTS_BY_ID.pop(product_id, None)
-        if not product:
+    # Expiry is second-granular, so a second sweep within the same second finds nothing.
+    if now_ts == _last_cleanup_ts:
+        return
+    _last_cleanup_ts = now_ts
+
+    while CUSTOM_PRODUCT_EXPIRY_HEAP and CUSTOM_PRODUCT_EXPIRY_HEAP[0][0] <= now_ts:
+        expires_at, product_id = heapq.heappop(CUSTOM_PRODUCT_EXPIRY_HEAP)
+        product = CUSTOM_PRODUCTS_BY_ID.get(product_id)
+        if not product or product.expires_at != expires_at:
             continue
-        creator_key = str(product.get("creator", "")).lower()
+        CUSTOM_PRODUCTS_BY_ID.pop(product_id, None)
+        creator_key = _address_key(product.creator)
         creator_products = CUSTOM_PRODUCTS_BY_CREATOR.get(creator_key)
-        if creator_products:
-            creator_products.discard(product_id)
+        if creator_products and product_id in creator_products:
+            creator_products.remove(product_id)
             if not creator_products:
                 CUSTOM_PRODUCTS_BY_CREATOR.pop(creator_key, None)
 
-    for creator_key, nonce_map in list(USED_CREATE_NONCES.items()):
-        for nonce in [nonce for nonce, expires_at in nonce_map.items() if expires_at <= now_ts]:
-            nonce_map.pop(nonce, None)
-        if not nonce_map:
-            USED_CREATE_NONCES.pop(creator_key, None)
+    while USED_CREATE_NONCE_EXPIRY_HEAP and USED_CREATE_NONCE_EXPIRY_HEAP[0][0] <= now_ts:
+        expires_at, nonce_key = heapq.heappop(USED_CREATE_NONCE_EXPIRY_HEAP)
+        if USED_CREATE_NONCES.get(nonce_key) == expires_at:
+            del USED_CREATE_NONCES[nonce_key]
 
+    # IPs are re-inserted on every create attempt, so dict order tracks last activity and
+    # idle windows sit at the front; stop at the first IP that is still active.
     cutoff = now_ts - CREATE_RATE_WINDOW_SECONDS
-    for ip, timestamps in list(CREATE_RATE_LIMIT_BY_IP.items()):
-        fresh = [ts for ts in timestamps if ts > cutoff]
-        if fresh:
-            CREATE_RATE_LIMIT_BY_IP[ip] = fresh
-        else:
-            CREATE_RATE_LIMIT_BY_IP.pop(ip, None)
+    while CREATE_RATE_LIMIT_BY_IP:
+        ip = next(iter(CREATE_RATE_LIMIT_BY_IP))
+        timestamps = CREATE_RATE_LIMIT_BY_IP[ip]
+        if timestamps and timestamps[-1] > cutoff:
+            break
+        del CREATE_RATE_LIMIT_BY_IP[ip]
 
 
-async def _rpc_request(method: str, params: list[Any]) -> Any:
+async def _rpc_batch(calls: list[tuple[str, list[Any]]]) -> list[dict[str, Any]]:
+    """Send several JSON-RPC calls in one POST; returns the sub-responses in call order."""
     if not RPC_URL:
         raise RuntimeError("RPC_URL is not configured")
-    payload = {
-        "jsonrpc": "2.0",
-        "id": int(time.time() * 1000),
-        "method": method,
-        "params": params,
-    }
+    payload = [
+        {"jsonrpc": "2.0", "id": idx, "method": method, "params": params}
+        for idx, (method, params) in enumerate(calls)
+    ]
     try:
-        resp = await http_client.post(RPC_URL, json=payload)
+        resp = await http_client.post(
+            RPC_URL, content=_json_bytes(payload), headers=JSON_REQUEST_HEADERS
+        )
         resp.raise_for_status()
-        body = resp.json()
+        # Results are hex strings, so orjson's float coercion of huge ints never applies.
+        body = orjson.loads(resp.content)
     except Exception as exc:
-        raise RuntimeError(f"RPC request failed for {method}: {exc}") from exc
-    if not isinstance(body, dict):
-        raise RuntimeError(f"RPC returned invalid response for {method}")
-    if body.get("error"):
-        raise RuntimeError(f"RPC error for {method}: {body['error']}")
-    return body.get("result")
+        raise RuntimeError(f"RPC batch request failed: {exc}") from exc
+    if not isinstance(body, list):
+        raise RuntimeError("RPC returned invalid batch response")
+    by_id = {item.get("id"): item for item in body if isinstance(item, dict)}
+    return [
+        by_id.get(idx) or {"error": f"missing response for {method}"}
+        for idx, (method, _) in enumerate(calls)
+    ]
 
 
 def _decode_uint256_hex(result: Any, field_name: str) -> int:
@@ -293,7 +543,7 @@ def _decode_abi_symbol(result: Any) -> str | None:
     if not raw:
         return None
     if len(raw) == 32:
-        text = raw.rstrip(b"\x00").decode("utf-8", errors="ignore").strip()
+        text_bytes = raw
     else:
         if len(raw) < 96:
             return None
@@ -306,45 +556,71 @@ def _decode_abi_symbol(result: Any) -> str | None:
             end = start + data_length
             if end > len(raw):
                 return None
-            text = raw[start:end].decode("utf-8", errors="ignore").strip()
+            text_bytes = raw[start:end]
         except Exception:
             return None
-    if not text:
-        return None
-    cleaned = "".join(ch for ch in text if 32 <= ord(ch) <= 126).strip()
+    # Keep printable ASCII only; dropping bytes before decoding also discards NUL
+    # padding and any non-ASCII UTF-8 sequences in one C-level pass.
+    cleaned = text_bytes.translate(None, NON_PRINTABLE_ASCII_BYTES).decode("ascii").strip()
     if not cleaned:
         return None
     return cleaned[:32]
 
 
 async def _resolve_token_metadata(token: str) -> tuple[int, str]:
-    code = await _rpc_request("eth_getCode", [token, "latest"])
+    cached = TOKEN_METADATA_CACHE.get(token)
+    if cached is not None:
+        return cached
+    lock = TOKEN_METADATA_LOCKS.setdefault(token, asyncio.Lock())
+    TOKEN_METADATA_LOCK_USERS[token] = TOKEN_METADATA_LOCK_USERS.get(token, 0) + 1
+    try:
+        async with lock:
+            cached = TOKEN_METADATA_CACHE.get(token)
+            if cached is not None:
+                return cached
+            metadata = await _fetch_token_metadata(token)
+            _bounded_cache_put(TOKEN_METADATA_CACHE, token, metadata, TOKEN_METADATA_CACHE_MAX)
+            return metadata
+    finally:
+        # lock.locked() is already False while queued waiters are still pending, so
+        # count users instead: popping early would split waiters and new callers
+        # across two locks and issue duplicate fetches.
+        remaining = TOKEN_METADATA_LOCK_USERS[token] - 1
+        if remaining:
+            TOKEN_METADATA_LOCK_USERS[token] = remaining
+        else:
+            del TOKEN_METADATA_LOCK_USERS[token]
+            TOKEN_METADATA_LOCKS.pop(token, None)
+
+
+async def _fetch_token_metadata(token: str) -> tuple[int, str]:
+    code_resp, decimals_resp, symbol_resp = await _rpc_batch(
+        [
+            ("eth_getCode", [token, "latest"]),
+            ("eth_call", [{"to": token, "data": "0x313ce567"}, "latest"]),
+            ("eth_call", [{"to": token, "data": "0x95d89b41"}, "latest"]),
+        ]
+    )
+    if code_resp.get("error"):
+        raise RuntimeError(f"RPC error for eth_getCode: {code_resp['error']}")
+    code = code_resp.get("result")
     if not isinstance(code, str) or code in {"0x", "0x0", "0x00"}:
         raise ValueError("Token address has no deployed contract code")
 
-    try:
-        decimals_hex = await _rpc_request(
-            "eth_call",
-            [{"to": token, "data": "0x313ce567"}, "latest"],
-        )
-    except RuntimeError as exc:
-        raise ValueError("Token contract does not expose decimals()") from exc
-
-    decimals = _decode_uint256_hex(decimals_hex, "decimals")
+    if decimals_resp.get("error"):
+        raise ValueError("Token contract does not expose decimals()")
+    decimals = _decode_uint256_hex(decimals_resp.get("result"), "decimals")
     if decimals < 0 or decimals > 255:
         raise ValueError("Token decimals() is out of supported bounds")
 
     symbol = "ERC20"
-    try:
-        symbol_hex = await _rpc_request(
-            "eth_call",
-            [{"to": token, "data": "0x95d89b41"}, "latest"],
-        )
-        decoded_symbol = _decode_abi_symbol(symbol_hex)
+    if not symbol_resp.get("error"):
+        try:
+            decoded_symbol = _decode_abi_symbol(symbol_resp.get("result"))
+        except Exception:
+            decoded_symbol = None
         if decoded_symbol:
             symbol = decoded_symbol
-    except Exception:
-        pass
     return decimals, symbol
 
 
@@ -356,22 +632,51 @@ def _custom_create_message(
     nonce: str,
     issued_at: int,
     expires_at: int,
-) -> str:
+) -> bytes:
+    # Byte-for-byte the text the browser demo signs; labels are pre-encoded.
+    return b"".join(
+        (
+            b"tez402 Custom Product Creation\nchainId:",
+            str(chain_id).encode("ascii"),
+            b"\ncreator:",
+            creator.encode("ascii"),
+            b"\ntoken:",
+            token.encode("ascii"),
+            b"\ntierId:",
+            tier_id.encode("utf-8"),
+            b"\nnonce:",
+            nonce.encode("utf-8"),
+            b"\nissuedAt:",
+            str(issued_at).encode("ascii"),
+            b"\nexpiresAt:",
+            str(expires_at).encode("ascii"),
+        )
+    )
+
+
+def _recover_personal_sign(message: bytes, signature: str) -> bytes:
+    # EIP-191 personal_sign recovery straight through eth_keys, which uses the
+    # libsecp256k1 (coincurve) backend when it is installed. Returns the raw 20-byte
+    # address: callers compare it against _address_key, so no checksum is needed.
+    msg_hash = _keccak(
+        b"\x19Ethereum Signed Message:\n" + str(len(message)).encode("ascii") + message
+    )
+    signature_bytes = bytes.fromhex(signature[2:])
+    if len(signature_bytes) != 65:
+        raise ValueError("signature must be 65 bytes")
+    v = signature_bytes[64]
+    if v >= 27:
+        v -= 27
     return (
-        "tez402 Custom Product Creation\n"
-        f"chainId:{chain_id}\n"
-        f"creator:{creator}\n"
-        f"token:{token}\n"
-        f"tierId:{tier_id}\n"
-        f"nonce:{nonce}\n"
-        f"issuedAt:{issued_at}\n"
-        f"expiresAt:{expires_at}"
+        keys.Signature(signature_bytes[:64] + bytes((v,)))
+        .recover_public_key_from_msg_hash(msg_hash)
+        .to_canonical_address()
     )
 
 
 def _tier_amount_to_base_units(tier_id: str, decimals: int) -> int:
-    tier_config = CUSTOM_PRODUCT_TIERS[tier_id]
-    scaled = Decimal(tier_config["amount"]) * (Decimal(10) ** decimals)
+    # scaleb shifts the exponent directly instead of building 10**decimals.
+    scaled = CUSTOM_PRODUCT_TIER_AMOUNTS[tier_id].scaleb(decimals)
     if scaled != scaled.to_integral_value():
         raise ValueError("Token decimals too small for selected tier amount")
     amount_int = int(scaled)
@@ -409,35 +714,34 @@ def _build_custom_product(
     decimals: int,
     symbol: str,
     now_ts: int,
-) -> dict[str, Any]:
+) -> Product:
     amount = _tier_amount_to_base_units(tier_id, decimals)
     product_id = f"custom_{uuid.uuid4().hex}"
     path = f"/api/custom/{product_id}"
     expires_at = now_ts + CUSTOM_PRODUCT_TTL_SECONDS
-    return {
-        "id": product_id,
-        "name": "Custom Token Access",
-        "path": path,
-        "description": "Custom token-gated content",
-        "requirements": _custom_product_requirements(token, str(amount), symbol, decimals),
-        "response": {
+    return Product(
+        id=product_id,
+        name="Custom Token Access",
+        path=path,
+        description="Custom token-gated content",
+        requirements=_custom_product_requirements(token, str(amount), symbol, decimals),
+        response={
             "content": "Custom token-gated content unlocked",
             "tierId": tier_id,
             "creator": creator,
             "asset": token,
             "symbol": symbol,
         },
-        "creator": creator,
-        "tierId": tier_id,
-        "expiresAt": expires_at,
-        "createdAt": now_ts,
-    }
+        creator=creator,
+        tier_id=tier_id,
+        expires_at=expires_at,
+        created_at=now_ts,
+    )
 
 
 def _payment_required(
-    request: Request,
     requirements: dict[str, Any],
-    resource_path: str,
+    resource_url: str,
     resource_description: str,
 ) -> dict[str, Any]:
     return {
@@ -446,39 +750,98 @@ def _payment_required(
         "resource": {
             "description": resource_description,
             "mimeType": "application/json",
-            "url": _resource_url(request, resource_path),
+            "url": resource_url,
         },
         "error": None,
     }
 
 
+def _payment_required_header(request: Request, product: Product) -> str:
+    # Product requirements are immutable once registered, so the encoded header only
+    # varies with the resource URL (public base + path).
+    resource_url = _resource_url(request, product.path)
+    cache_key = (product.id, resource_url)
+    header = PAYMENT_REQUIRED_HEADER_CACHE.get(cache_key)
+    if header is None:
+        header = binascii.b2a_base64(
+            _json_bytes(
+                _payment_required(
+                    product.requirements,
+                    resource_url,
+                    product.description,
+                )
+            ),
+            newline=False,
+        ).decode()
+        _bounded_cache_put(
+            PAYMENT_REQUIRED_HEADER_CACHE, cache_key, header, PAYMENT_REQUIRED_HEADER_CACHE_MAX
+        )
+    return header
+
+
 def _get_payment_header(request: Request) -> str | None:
-    # V2 spec: Payment-Signature
-    return request.headers.get("Payment-Signature") or request.headers.get(
-        "payment-signature"
-    )
+    # V2 spec: Payment-Signature. Starlette header lookups are already case-insensitive.
+    return request.headers.get("payment-signature")
 
 
-def _requirements_match(accepted: dict, required: dict) -> bool:
+def _requirements_match(accepted: dict, product: Product) -> bool:
     # Accept additional non-critical fields from clients, but enforce all settlement-critical terms exactly.
-    if not isinstance(accepted, dict) or not isinstance(required, dict):
+    if not isinstance(accepted, dict):
         return False
+    return _requirements_key(accepted) == product.requirements_key
 
-    critical_keys = (
-        "scheme",
-        "network",
-        "amount",
-        "payTo",
-        "maxTimeoutSeconds",
-        "asset",
-    )
-    for key in critical_keys:
-        if str(accepted.get(key)) != str(required.get(key)):
-            return False
 
-    return accepted.get("extra") == required.get("extra")
+class CustomCreateRequest(msgspec.Struct, rename="camel"):
+    creator: str
+    token: str
+    tier_id: str
+    nonce: str
+    issued_at: int
+    expires_at: int
+    chain_id: int
+    signature: str
 
-def _extract_permit2_payload(payment_payload: dict) -> dict | None:
+
+def _custom_create_validation_error(body: bytes) -> str:
+    # Only reached when the typed decode fails. msgspec stops at the first bad field in
+    # document order, so re-check untyped in the endpoint's own order to keep the
+    # per-field messages it has always returned.
+    payload = msgspec.json.decode(body)
+    if not isinstance(payload, dict):
+        return "Invalid payload format"
+    tier_id = payload.get("tierId")
+    if not isinstance(tier_id, str) or tier_id not in CUSTOM_PRODUCT_TIERS:
+        return "Invalid tierId"
+    nonce = payload.get("nonce")
+    if not isinstance(nonce, str) or not nonce.strip():
+        return "Invalid nonce"
+    if not isinstance(payload.get("signature"), str):
+        return "Invalid signature"
+    try:
+        for key in ("chainId", "issuedAt", "expiresAt"):
+            int(payload.get(key))
+    except (TypeError, ValueError):
+        return "Invalid chainId/issuedAt/expiresAt"
+    for key in ("creator", "token"):
+        if not isinstance(payload.get(key), str):
+            return f"Invalid {key}: must be a string"
+    return "Invalid payload format"
+
+
+class Permit2Fields(NamedTuple):
+    owner: Any
+    spender: Any
+    token: Any
+    amount: Any
+    nonce: Any
+    deadline: Any
+    witness_to: Any
+    witness_valid_after: Any
+    witness_extra: Any
+    signature: Any
+
+
+def _extract_permit2_payload(payment_payload: dict) -> Permit2Fields | None:
     if not isinstance(payment_payload, dict):
         return None
     payload = payment_payload.get("payload")
@@ -487,69 +850,60 @@ def _extract_permit2_payload(payment_payload: dict) -> dict | None:
     # Coinbase x402 witness flow: SignatureTransfer (PermitWitnessTransferFrom)
     permit2_auth = payload.get("permit2Authorization")
     signature = payload.get("signature")
-    if isinstance(permit2_auth, dict) and signature:
-        return {
-            "permit2Authorization": permit2_auth,
-            "signature": signature,
-        }
+    if not isinstance(permit2_auth, dict) or not signature:
+        return None
 
-    return None
+    permitted = permit2_auth.get("permitted")
+    if not isinstance(permitted, dict):
+        permitted = {}
+    witness = permit2_auth.get("witness")
+    if not isinstance(witness, dict):
+        witness = {}
+    return Permit2Fields(
+        owner=permit2_auth.get("from"),
+        spender=permit2_auth.get("spender"),
+        token=permitted.get("token"),
+        amount=permitted.get("amount"),
+        nonce=permit2_auth.get("nonce"),
+        deadline=permit2_auth.get("deadline"),
+        witness_to=witness.get("to"),
+        witness_valid_after=witness.get("validAfter"),
+        witness_extra=witness.get("extra"),
+        signature=signature,
+    )
 
 
-def _catalog_product(request: Request, product: dict[str, Any]) -> dict[str, Any]:
-    requirements = product["requirements"]
-    catalog_entry = {
-        "id": product["id"],
-        "name": product["name"],
-        "path": product["path"],
-        "url": _resource_url(request, product["path"]),
-        "description": product["description"],
-        "payment": {
-            "x402Version": 2,
-            "scheme": requirements["scheme"],
-            "network": requirements["network"],
-            "amount": requirements["amount"],
-            "payTo": requirements["payTo"],
-            "asset": requirements["asset"],
-            "maxTimeoutSeconds": requirements["maxTimeoutSeconds"],
-            "extra": requirements.get("extra"),
-        },
-    }
-    if "expiresAt" in product:
-        catalog_entry["expiresAt"] = product["expiresAt"]
+def _catalog_product(request: Request, product: Product) -> dict[str, Any]:
+    catalog_entry = dict(product.catalog_entry)
+    catalog_entry["url"] = _resource_url(request, product.path)
     return catalog_entry
 
 
+def _extract_tx_hash(settle_data: dict[str, Any]) -> str | None:
+    tx_hash = settle_data.get("txHash")
+    if tx_hash:
+        return tx_hash
+    transaction = settle_data.get("transaction")
+    if isinstance(transaction, dict):
+        return transaction.get("hash")
+    if isinstance(transaction, str) and transaction.startswith("0x") and len(transaction) == 66:
+        return transaction
+    return None
+
+
 async def _handle_paid_product(
     request: Request,
-    product: dict[str, Any],
+    product: Product,
+    now: int | None = None,
 ) -> Response:
-    requirements = product["requirements"]
-    product_response = product["response"]
+    requirements = product.requirements
+    product_response = product.response
     payment_header = _get_payment_header(request)
-    gas_payer_header = request.headers.get("X-GAS-PAYER") or request.headers.get(
-        "x-gas-payer"
-    )
-    gas_payer = gas_payer_header.lower() if gas_payer_header else "auto"
 
     if not payment_header:
-        payload = base64.b64encode(
-            json.dumps(
-                _payment_required(
-                    request,
-                    requirements,
-                    product["path"],
-                    product["description"],
-                )
-            ).encode()
-        ).decode()
+        payload = _payment_required_header(request, product)
         return Response(
-            content=json.dumps(
-                {
-                    "error": "Payment Required",
-                    "message": "Send Payment-Signature header",
-                }
-            ),
+            content=PAYMENT_REQUIRED_BODY,
             status_code=402,
             # V2: Payment-Required (base64 encoded PaymentRequired JSON)
             headers={"Payment-Required": payload},
@@ -559,213 +913,127 @@ async def _handle_paid_product(
     try:
         if len(payment_header) > MAX_PAYMENT_SIGNATURE_B64_BYTES:
             raise ValueError("Payment-Signature header too large")
-        decoded_payload = base64.b64decode(payment_header, validate=True)
+        # Single strict pass: rejects non-alphabet characters and bad padding like
+        # b64decode(validate=True) without a separate validation scan.
+        decoded_payload = binascii.a2b_base64(payment_header.encode("ascii"), strict_mode=True)
+        # stdlib json on purpose: orjson silently turns integers wider than 64 bits into
+        # floats, and this payload carries uint256 Permit2 fields from the client.
         payment_payload = json.loads(decoded_payload)
         log_json(logger, logging.DEBUG, "Received payment payload", payment_payload)
     except Exception as e:
         logger.warning("Invalid payment header: %s", e)
-        return Response(
-            content=json.dumps({"error": f"Invalid payment header: {e}"}),
-            status_code=400,
-            media_type="application/json",
-        )
-
-    requirements_for_facilitator = copy.deepcopy(requirements)
+        return _error_response(400, f"Invalid payment header: {e}")
 
     if not isinstance(payment_payload, dict):
-        return Response(
-            content=json.dumps({"error": "Invalid payment payload"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Invalid payment payload")
 
     accepted = payment_payload.get("accepted")
     if not isinstance(accepted, dict):
-        return Response(
-            content=json.dumps(
-                {
-                    "error": "Missing accepted requirements in payment payload (x402 v2)",
-                }
-            ),
-            status_code=400,
-            media_type="application/json",
-        )
-
-    if not _requirements_match(accepted, requirements):
-        return Response(
-            content=json.dumps(
-                {
-                    "error": "Accepted requirements do not match offered requirements",
-                    "offered": requirements,
-                    "accepted": accepted,
-                }
-            ),
+        return _error_response(400, "Missing accepted requirements in payment payload (x402 v2)")
+
+    if not _requirements_match(accepted, product):
+        return JSONBytesResponse(
+            {
+                "error": "Accepted requirements do not match offered requirements",
+                "offered": requirements,
+                "accepted": accepted,
+            },
             status_code=402,
-            media_type="application/json",
         )
 
     permit2_payload = _extract_permit2_payload(payment_payload)
     if not permit2_payload:
-        return Response(
-            content=json.dumps({"error": "Missing permit2 payload"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Missing permit2 payload")
 
-    pay_to = requirements_for_facilitator.get("payTo")
+    pay_to = requirements.get("payTo")
     if not pay_to:
-        return Response(
-            content=json.dumps({"error": "Missing payTo in requirements"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Missing payTo in requirements")
+
+    (
+        owner,
+        spender,
+        token,
+        amount_raw,
+        nonce_raw,
+        deadline_raw,
+        witness_to,
+        witness_valid_after_raw,
+        witness_extra_raw,
+        signature_raw,
+    ) = permit2_payload
+
+    # Cheapest decisive check first: a wrong amount is rejected before any witness,
+    # address or signature validation runs.
+    if isinstance(amount_raw, bool) or not isinstance(amount_raw, (str, int)):
+        return _error_response(400, "Invalid payment amount")
+    try:
+        payment_amount = int(amount_raw)
+    except ValueError:
+        return _error_response(400, "Invalid payment amount")
+    if payment_amount != product.required_amount:
+        return _error_response(402, "Payment amount mismatch")
 
-    permit2_auth = permit2_payload.get("permit2Authorization", {}) or {}
-    permitted = permit2_auth.get("permitted", {}) or {}
-    witness = permit2_auth.get("witness", {}) or {}
-
-    owner = permit2_auth.get("from")
-    spender = permit2_auth.get("spender")
-    token = permitted.get("token")
-    amount_raw = permitted.get("amount")
-    nonce_raw = permit2_auth.get("nonce")
-    deadline_raw = permit2_auth.get("deadline")
-    signature_raw = permit2_payload.get("signature")
-
-    witness_to = witness.get("to")
-    witness_valid_after_raw = witness.get("validAfter")
-    witness_extra_raw = witness.get("extra")
     if not witness_to or witness_valid_after_raw is None or witness_extra_raw is None:
-        return Response(
-            content=json.dumps(
-                {"error": "Missing required witness fields in permit2Authorization"}
-            ),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Missing required witness fields in permit2Authorization")
     if not _same_address(witness_to, pay_to):
-        return Response(
-            content=json.dumps(
-                {"error": "Recipient mismatch (witness.to must equal payTo)"}
-            ),
-            status_code=402,
-            media_type="application/json",
-        )
-    if not _same_address(spender, X402_EXACT_PERMIT2_PROXY_ADDRESS):
-        return Response(
-            content=json.dumps(
-                {
-                    "error": "Invalid spender for witness flow (must be configured x402 proxy)",
-                }
-            ),
-            status_code=402,
-            media_type="application/json",
-        )
+        return _error_response(402, "Recipient mismatch (witness.to must equal payTo)")
+    if str(spender).lower() != X402_EXACT_PERMIT2_PROXY_ADDRESS_LOWER:
+        return _error_response(402, "Invalid spender for witness flow (must be configured x402 proxy)")
 
     if (
         not owner
         or not spender
         or not token
-        or amount_raw is None
         or nonce_raw is None
         or deadline_raw is None
     ):
-        return Response(
-            content=json.dumps(
-                {
-                    "error": "Incomplete permit2 payload (missing owner/spender/token/amount/nonce/deadline)",
-                }
-            ),
-            status_code=400,
-            media_type="application/json",
-        )
-    try:
-        owner = _to_checksum(owner, "payment owner")
-        spender = _to_checksum(spender, "payment spender")
-        token = _to_checksum(token, "payment token")
-    except RuntimeError as exc:
-        return Response(
-            content=json.dumps({"error": str(exc)}),
-            status_code=400,
-            media_type="application/json",
-        )
-
-    try:
-        required_amount = int(requirements_for_facilitator.get("amount", "0"))
-        payment_amount = int(amount_raw)
-    except (TypeError, ValueError):
-        return Response(
-            content=json.dumps({"error": "Invalid payment amount"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Incomplete permit2 payload (missing owner/spender/token/nonce/deadline)")
+    # These are only compared case-insensitively below, so validate the hex shape and
+    # normalize to a 0x-prefixed form without paying for an EIP-55 checksum.
+    normalized_addresses = []
+    for field_name, raw_address in (
+        ("payment owner", owner),
+        ("payment spender", spender),
+        ("payment token", token),
+    ):
+        match = HEX_ADDRESS_RE.fullmatch(raw_address) if isinstance(raw_address, str) else None
+        if not match:
+            return _error_response(400, f"Invalid {field_name}: {raw_address}")
+        normalized_addresses.append("0x" + match.group(1))
+    owner, spender, token = normalized_addresses
 
     try:
         nonce_value = int(nonce_raw)
         deadline_value = int(deadline_raw)
         witness_valid_after = int(witness_valid_after_raw)
     except (TypeError, ValueError):
-        return Response(
-            content=json.dumps(
-                {"error": "Invalid nonce/deadline/witness.validAfter in permit2Authorization"}
-            ),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Invalid nonce/deadline/witness.validAfter in permit2Authorization")
 
     if nonce_value < 0 or deadline_value <= 0 or witness_valid_after < 0:
-        return Response(
-            content=json.dumps({"error": "Invalid permit2Authorization numeric bounds"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Invalid permit2Authorization numeric bounds")
 
     if witness_valid_after > deadline_value:
-        return Response(
-            content=json.dumps({"error": "Invalid witness window (validAfter > deadline)"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Invalid witness window (validAfter > deadline)")
 
-    max_timeout_seconds = int(
-        requirements_for_facilitator.get("maxTimeoutSeconds", "0") or 0
-    )
-    now = int(time.time())
+    max_timeout_seconds = product.max_timeout_seconds
+    if now is None:
+        now = int(time.time())
     if max_timeout_seconds > 0 and deadline_value > (now + max_timeout_seconds + 6):
-        return Response(
-            content=json.dumps({"error": "Permit2 deadline exceeds maxTimeoutSeconds"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Permit2 deadline exceeds maxTimeoutSeconds")
 
-    if not isinstance(signature_raw, str) or not signature_raw.startswith("0x"):
-        return Response(
-            content=json.dumps({"error": "Invalid signature in permit2 payload"}),
-            status_code=400,
-            media_type="application/json",
-        )
-
-    if payment_amount != required_amount:
-        return Response(
-            content=json.dumps({"error": "Payment amount mismatch"}),
-            status_code=402,
-            media_type="application/json",
-        )
+    # Reject malformed hex here instead of at the facilitator. Length is not pinned to 65:
+    # Permit2 also accepts EIP-2098 and EIP-1271 (contract) signatures.
+    if not isinstance(signature_raw, str) or not PERMIT2_SIGNATURE_RE.fullmatch(signature_raw):
+        return _error_response(400, "Invalid signature in permit2 payload")
 
-    required_asset = requirements_for_facilitator.get("asset")
+    required_asset = requirements.get("asset")
     if not required_asset or not _same_address(token, required_asset):
-        return Response(
-            content=json.dumps({"error": "Payment asset mismatch"}),
-            status_code=402,
-            media_type="application/json",
-        )
+        return _error_response(402, "Payment asset mismatch")
 
+    gas_payer_header = request.headers.get("x-gas-payer")
+    gas_payer = gas_payer_header.lower() if gas_payer_header else "auto"
     if gas_payer not in {"facilitator", "auto"}:
-        return Response(
-            content=json.dumps({"error": "Only facilitator gas mode is supported"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Only facilitator gas mode is supported")
 
     gas_payer = "facilitator"
     logger.info("Gas payer mode: %s", gas_payer)
@@ -773,43 +1041,40 @@ async def _handle_paid_product(
     settle_request = {
         "x402Version": 2,
         "paymentPayload": payment_payload,
-        "paymentRequirements": requirements_for_facilitator,
+        "paymentRequirements": requirements,
     }
 
     logger.info("Calling facilitator /settle: %s/settle", FACILITATOR_URL)
     log_json(logger, logging.DEBUG, "Settle request", settle_request)
 
     try:
-        settle_resp = await http_client.post(
+        async with http_client.stream(
+            "POST",
             f"{FACILITATOR_URL}/settle",
-            json=settle_request,
-        )
-        settle_bytes = settle_resp.content or b""
-        if len(settle_bytes) > MAX_SETTLE_RESPONSE_BYTES:
-            return Response(
-                content=json.dumps({"error": "Settlement response too large"}),
-                status_code=502,
-                media_type="application/json",
-            )
-        settle_text = settle_bytes.decode("utf-8", errors="replace")
+            content=_json_bytes(settle_request),
+            headers=JSON_REQUEST_HEADERS,
+        ) as settle_resp:
+            # Reject oversized bodies from the advertised length before reading them,
+            # and cap the read for chunked responses that carry no Content-Length.
+            content_length = settle_resp.headers.get("content-length", "")
+            if content_length.isdigit() and int(content_length) > MAX_SETTLE_RESPONSE_BYTES:
+                return _error_response(502, "Settlement response too large")
+            settle_bytes = bytearray()
+            async for chunk in settle_resp.aiter_bytes():
+                settle_bytes += chunk
+                if len(settle_bytes) > MAX_SETTLE_RESPONSE_BYTES:
+                    return _error_response(502, "Settlement response too large")
         try:
-            settle_data = settle_resp.json()
-        except Exception:
-            try:
-                settle_data = json.loads(settle_text)
-            except json.JSONDecodeError:
-                settle_data = {"raw": settle_text}
+            # stdlib json like the payment decode: this body is echoed back as
+            # facilitator_response, and orjson would turn >64-bit integers into floats.
+            settle_data = json.loads(settle_bytes)
+        except ValueError:
+            settle_data = {"raw": settle_bytes.decode("utf-8", errors="replace")}
 
         if not isinstance(settle_data, dict):
-            return Response(
-                content=json.dumps(
-                    {
-                        "error": "Settlement failed",
-                        "facilitator_response": settle_data,
-                    }
-                ),
+            return JSONBytesResponse(
+                {"error": "Settlement failed", "facilitator_response": settle_data},
                 status_code=402,
-                media_type="application/json",
             )
         log_json(
             logger,
@@ -819,66 +1084,55 @@ async def _handle_paid_product(
         )
 
         if settle_resp.status_code != 200:
-            return Response(
-                content=json.dumps(
-                    {
-                        "error": "Settlement failed",
-                        "facilitator_response": settle_data,
-                    }
-                ),
+            return JSONBytesResponse(
+                {"error": "Settlement failed", "facilitator_response": settle_data},
                 status_code=402,
-                media_type="application/json",
             )
 
-        tx_hash = None
-        tx_hash = settle_data.get("txHash")
-        if not tx_hash:
-            transaction = settle_data.get("transaction")
-            if isinstance(transaction, dict):
-                tx_hash = transaction.get("hash")
-            elif isinstance(transaction, str):
-                if transaction.startswith("0x") and len(transaction) == 66:
-                    tx_hash = transaction
+        tx_hash = _extract_tx_hash(settle_data)
 
     except Exception as e:
         logger.exception("Facilitator error: %s", e)
-        return Response(
-            content=json.dumps({"error": f"Facilitator error: {e}"}),
-            status_code=500,
-            media_type="application/json",
-        )
+        return _error_response(500, f"Facilitator error: {e}")
 
+    explorer_url = _explorer_url(tx_hash)
     response_payload = {
         "success": True,
         "txHash": tx_hash,
         "gasPayer": gas_payer,
         "network": NETWORK,
-        "explorer": _explorer_url(tx_hash),
-        "productId": product["id"],
+        "explorer": explorer_url,
+        "productId": product.id,
     }
-    x_payment_response = base64.b64encode(
-        json.dumps(response_payload).encode()
+    x_payment_response = binascii.b2a_base64(
+        _json_bytes(response_payload), newline=False
     ).decode()
 
-    paid_body = dict(product_response)
-    paid_body.update(
-        {
-            "productId": product["id"],
-            "payment_settled": True,
-            "txHash": tx_hash,
-            "explorer": _explorer_url(tx_hash),
-        }
-    )
+    paid_body = {
+        **product_response,
+        "productId": product.id,
+        "payment_settled": True,
+        "txHash": tx_hash,
+        "explorer": explorer_url,
+    }
 
-    return Response(
-        content=json.dumps(paid_body),
+    return JSONBytesResponse(
+        paid_body,
         status_code=200,
         # Match x402-axum's response header name.
         headers={"X-Payment-Response": x_payment_response},
-        media_type="application/json",
     )
 
 
+async def _periodic_cleanup() -> None:
+    while True:
+        await asyncio.sleep(CUSTOM_STATE_CLEANUP_INTERVAL_SECONDS)
+        try:
+            _cleanup_custom_state()
+        except Exception:
+            logger.exception("Custom product cleanup failed")
+
+
 @app.get("/")
 async def root():
     return {
@@ -897,7 +1151,7 @@ async def config():
         "network": NETWORK,
         "asset": BBT_TOKEN,
         "payTo": SERVER_WALLET,
-        "amount": default_product["requirements"]["amount"],
+        "amount": default_product.requirements["amount"],
         "facilitatorUrl": FACILITATOR_URL,
         "defaultProductId": DEFAULT_PRODUCT_ID,
         "features": {
@@ -917,30 +1171,7 @@ async def config():
     }
 
 
-@app.get("/api/catalog")
-async def catalog(request: Request):
-    _cleanup_custom_state()
-    products = [
-        _catalog_product(request, PRODUCTS["weather"]),
-        _catalog_product(request, PRODUCTS["premium-content"]),
-    ]
-
-    creator = request.query_params.get("creator")
-    if CUSTOM_PRODUCTS_ENABLED and creator:
-        try:
-            creator_checksum = _to_checksum_strict(creator, "creator query parameter")
-        except RuntimeError as exc:
-            return Response(
-                content=json.dumps({"error": str(exc)}),
-                status_code=400,
-                media_type="application/json",
-            )
-        creator_key = creator_checksum.lower()
-        for product_id in sorted(CUSTOM_PRODUCTS_BY_CREATOR.get(creator_key, set())):
-            product = CUSTOM_PRODUCTS_BY_ID.get(product_id)
-            if product:
-                products.append(_catalog_product(request, product))
-
+def _catalog_body(products: list[dict[str, Any]]) -> dict[str, Any]:
     return {
         "store": "tez402 Store",
         "network": NETWORK,
@@ -948,211 +1179,219 @@ async def catalog(request: Request):
     }
 
 
+def _accepts_gzip(accept_encoding: str) -> bool:
+    # An explicit gzip entry wins over "*"; either one with q=0 is a refusal.
+    wildcard_ok = False
+    for entry in accept_encoding.split(","):
+        coding, _, params = entry.partition(";")
+        coding = coding.strip().lower()
+        if coding not in {"gzip", "*"}:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding == "gzip":
+            return quality > 0
+        wildcard_ok = quality > 0
+    return wildcard_ok
+
+
+def _anonymous_catalog_response(request: Request) -> Response:
+    # Without a creator filter only built-in products are listed, so the encoded body
+    # varies with nothing but the public base URL; it is encoded (and, when large enough,
+    # gzipped) once.
+    cache_key = _resource_url(request, "/")
+    cached = CATALOG_RESPONSE_CACHE.get(cache_key)
+    if cached is None:
+        body = _json_bytes(
+            _catalog_body([_catalog_product(request, product) for product in PRODUCTS.values()])
+        )
+        digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+        gzip_body = (
+            gzip.compress(body, compresslevel=6) if len(body) >= CATALOG_GZIP_MIN_BYTES else None
+        )
+        cached = (body, gzip_body, digest)
+        _bounded_cache_put(CATALOG_RESPONSE_CACHE, cache_key, cached, CATALOG_RESPONSE_CACHE_MAX)
+    body, gzip_body, digest = cached
+    use_gzip = gzip_body is not None and _accepts_gzip(request.headers.get("accept-encoding", ""))
+    etag = f'"{digest}-gzip"' if use_gzip else f'"{digest}"'
+    headers = {"Vary": "Accept-Encoding", "ETag": etag}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        # No body on a 304, so no Content-Encoding either.
+        return Response(status_code=304, headers=headers)
+    if use_gzip:
+        body = gzip_body
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/api/catalog")
+async def catalog(request: Request):
+    creator = request.query_params.get("creator")
+    if not (CUSTOM_PRODUCTS_ENABLED and creator):
+        return _anonymous_catalog_response(request)
+
+    try:
+        creator_checksum = _to_checksum_strict(creator, "creator query parameter")
+    except RuntimeError as exc:
+        return _error_response(400, str(exc))
+    products = [_catalog_product(request, product) for product in PRODUCTS.values()]
+    creator_key = _address_key(creator_checksum)
+    now_ts = int(time.time())
+    for product_id in CUSTOM_PRODUCTS_BY_CREATOR.get(creator_key, ()):
+        product = CUSTOM_PRODUCTS_BY_ID.get(product_id)
+        if product and product.expires_at > now_ts:
+            products.append(_catalog_product(request, product))
+    return _catalog_body(products)
+
+
 @app.post("/api/catalog/custom-token")
 async def create_custom_token_product(request: Request):
     if not CUSTOM_PRODUCTS_ENABLED:
-        return Response(
-            content=json.dumps({"error": "Custom token products are disabled"}),
-            status_code=404,
-            media_type="application/json",
-        )
+        return _error_response(404, "Custom token products are disabled")
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > CUSTOM_CREATE_MAX_BODY_BYTES:
+        return _error_response(413, "Create request body too large")
 
     now_ts = int(time.time())
     _cleanup_custom_state(now_ts)
 
-    client_ip = _client_ip(request)
-    ip_activity = CREATE_RATE_LIMIT_BY_IP.setdefault(client_ip, [])
+    ip_key = _client_ip_key(request)
+    ip_activity = CREATE_RATE_LIMIT_BY_IP.pop(ip_key, None) or deque()
+    CREATE_RATE_LIMIT_BY_IP[ip_key] = ip_activity
+    _expire_rate_window(ip_activity, now_ts - CREATE_RATE_WINDOW_SECONDS)
     if len(ip_activity) >= CUSTOM_PRODUCT_CREATE_MAX_PER_IP_PER_HOUR:
-        return Response(
-            content=json.dumps({"error": "Create rate limit exceeded for this IP"}),
-            status_code=429,
-            media_type="application/json",
-        )
+        return _error_response(429, "Create rate limit exceeded for this IP")
     ip_activity.append(now_ts)
 
+    # Parse and type-check the body in one pass; lax mode keeps accepting numeric strings
+    # for chainId/issuedAt/expiresAt as the previous int() coercion did.
+    # Count streamed bytes too: chunked uploads carry no Content-Length.
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > CUSTOM_CREATE_MAX_BODY_BYTES:
+            return _error_response(413, "Create request body too large")
     try:
-        payload = await request.json()
-    except Exception:
-        return Response(
-            content=json.dumps({"error": "Invalid JSON payload"}),
-            status_code=400,
-            media_type="application/json",
-        )
-    if not isinstance(payload, dict):
-        return Response(
-            content=json.dumps({"error": "Invalid payload format"}),
-            status_code=400,
-            media_type="application/json",
-        )
-
-    nonce = payload.get("nonce")
-    tier_id = payload.get("tierId")
-    signature = payload.get("signature")
-    chain_id_raw = payload.get("chainId")
-    issued_at_raw = payload.get("issuedAt")
-    expires_at_raw = payload.get("expiresAt")
+        create_request = msgspec.json.decode(body, type=CustomCreateRequest, strict=False)
+    except msgspec.ValidationError:
+        return _error_response(400, _custom_create_validation_error(body))
+    except msgspec.DecodeError:
+        return _error_response(400, "Invalid JSON payload")
+
+    tier_id = create_request.tier_id
+    signature = create_request.signature
+    chain_id = create_request.chain_id
+    issued_at = create_request.issued_at
+    expires_at = create_request.expires_at
 
     if tier_id not in CUSTOM_PRODUCT_TIERS:
-        return Response(
-            content=json.dumps({"error": "Invalid tierId"}),
-            status_code=400,
-            media_type="application/json",
-        )
-    if not isinstance(nonce, str) or not nonce.strip():
-        return Response(
-            content=json.dumps({"error": "Invalid nonce"}),
-            status_code=400,
-            media_type="application/json",
-        )
-    nonce = nonce.strip()
+        return _error_response(400, "Invalid tierId")
+    nonce = create_request.nonce.strip()
+    if not nonce:
+        return _error_response(400, "Invalid nonce")
     if len(nonce) > 256:
-        return Response(
-            content=json.dumps({"error": "Nonce too long"}),
-            status_code=400,
-            media_type="application/json",
-        )
-    if not isinstance(signature, str) or not signature.startswith("0x"):
-        return Response(
-            content=json.dumps({"error": "Invalid signature"}),
-            status_code=400,
-            media_type="application/json",
-        )
-
-    try:
-        chain_id = int(chain_id_raw)
-        issued_at = int(issued_at_raw)
-        expires_at = int(expires_at_raw)
-    except (TypeError, ValueError):
-        return Response(
-            content=json.dumps({"error": "Invalid chainId/issuedAt/expiresAt"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Nonce too long")
+    # Reject malformed signatures here so junk requests never reach secp256k1 recovery,
+    # which only runs after the rate-limit, nonce and product-limit checks.
+    if not PERSONAL_SIGNATURE_RE.fullmatch(signature):
+        return _error_response(400, "Invalid signature")
 
     if chain_id != CHAIN_ID:
-        return Response(
-            content=json.dumps({"error": f"Unsupported chainId (expected {CHAIN_ID})"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, f"Unsupported chainId (expected {CHAIN_ID})")
     if issued_at <= 0 or expires_at <= 0 or expires_at <= issued_at:
-        return Response(
-            content=json.dumps({"error": "Invalid issuedAt/expiresAt bounds"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Invalid issuedAt/expiresAt bounds")
     if (expires_at - issued_at) > CUSTOM_PRODUCT_SIGNATURE_MAX_AGE_SECONDS:
-        return Response(
-            content=json.dumps({"error": "Signature validity window is too large"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Signature validity window is too large")
     if issued_at > now_ts + CUSTOM_CREATE_CLOCK_SKEW_SECONDS:
-        return Response(
-            content=json.dumps({"error": "issuedAt is too far in the future"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "issuedAt is too far in the future")
     if expires_at < now_ts:
-        return Response(
-            content=json.dumps({"error": "Create request signature is expired"}),
-            status_code=400,
-            media_type="application/json",
-        )
+        return _error_response(400, "Create request signature is expired")
 
     try:
-        creator = _to_checksum_strict(payload.get("creator"), "creator")
-        token = _to_checksum_strict(payload.get("token"), "token")
+        creator = _to_checksum_strict(create_request.creator, "creator")
+        token = _to_checksum_strict(create_request.token, "token")
     except RuntimeError as exc:
-        return Response(
-            content=json.dumps({"error": str(exc)}),
-            status_code=400,
-            media_type="application/json",
-        )
-
-    creator_key = creator.lower()
-    used_nonces = USED_CREATE_NONCES.setdefault(creator_key, {})
-    if nonce in used_nonces:
-        return Response(
-            content=json.dumps({"error": "Nonce already used for creator"}),
-            status_code=400,
-            media_type="application/json",
-        )
-
-    creator_products = CUSTOM_PRODUCTS_BY_CREATOR.get(creator_key, set())
+        return _error_response(400, str(exc))
+
+    creator_key = _address_key(creator)
+    nonce_key = (creator_key, nonce)
+    # A nonce is only recorded once creation succeeds; the in-flight set rejects a
+    # concurrent duplicate before it repeats the signature recovery and token RPC.
+    if nonce_key in USED_CREATE_NONCES:
+        return _error_response(400, "Nonce already used for creator")
+    if nonce_key in CREATE_NONCES_IN_FLIGHT:
+        # Not recorded yet: the first attempt may still fail and leave the nonce usable.
+        return _error_response(409, "Create already in progress for this nonce")
+
+    creator_products = CUSTOM_PRODUCTS_BY_CREATOR.get(creator_key, ())
     if len(creator_products) >= CUSTOM_PRODUCT_MAX_PER_CREATOR:
-        return Response(
-            content=json.dumps({"error": "Creator active custom product limit reached"}),
-            status_code=429,
-            media_type="application/json",
-        )
+        return _error_response(429, "Creator active custom product limit reached")
     if len(CUSTOM_PRODUCTS_BY_ID) >= CUSTOM_PRODUCT_MAX_GLOBAL:
-        return Response(
-            content=json.dumps({"error": "Global custom product limit reached"}),
-            status_code=429,
-            media_type="application/json",
-        )
+        return _error_response(429, "Global custom product limit reached")
 
-    message = _custom_create_message(
-        chain_id=chain_id,
-        creator=creator,
-        token=token,
-        tier_id=tier_id,
-        nonce=nonce,
-        issued_at=issued_at,
-        expires_at=expires_at,
-    )
+    CREATE_NONCES_IN_FLIGHT.add(nonce_key)
     try:
-        recovered = Web3().eth.account.recover_message(
-            encode_defunct(text=message),
-            signature=signature,
-        )
-    except Exception as exc:
-        return Response(
-            content=json.dumps({"error": f"Invalid signature: {exc}"}),
-            status_code=400,
-            media_type="application/json",
-        )
-
-    if not _same_address(recovered, creator):
-        return Response(
-            content=json.dumps({"error": "Signature does not match creator"}),
-            status_code=401,
-            media_type="application/json",
-        )
+        try:
+            message = _custom_create_message(
+                chain_id=chain_id,
+                creator=creator,
+                token=token,
+                tier_id=tier_id,
+                nonce=nonce,
+                issued_at=issued_at,
+                expires_at=expires_at,
+            )
+            # secp256k1 recovery is CPU work; keep it off the event loop.
+            recovered = await asyncio.to_thread(_recover_personal_sign, message, signature)
+        except Exception as exc:
+            return _error_response(400, f"Invalid signature: {exc}")
 
-    try:
-        decimals, symbol = await _resolve_token_metadata(token)
-        product = _build_custom_product(
-            creator=creator,
-            token=token,
-            tier_id=tier_id,
-            decimals=decimals,
-            symbol=symbol,
-            now_ts=now_ts,
-        )
-    except ValueError as exc:
-        return Response(
-            content=json.dumps({"error": str(exc)}),
-            status_code=400,
-            media_type="application/json",
-        )
-    except RuntimeError as exc:
-        logger.exception("Token metadata RPC failure: %s", exc)
-        return Response(
-            content=json.dumps({"error": "Failed to validate token metadata via RPC"}),
-            status_code=502,
-            media_type="application/json",
-        )
+        if recovered != creator_key:
+            return _error_response(401, "Signature does not match creator")
 
-    CUSTOM_PRODUCTS_BY_ID[product["id"]] = product
-    CUSTOM_PRODUCTS_BY_CREATOR.setdefault(creator_key, set()).add(product["id"])
-    used_nonces[nonce] = expires_at
+        try:
+            decimals, symbol = await _resolve_token_metadata(token)
+            product = _build_custom_product(
+                creator=creator,
+                token=token,
+                tier_id=tier_id,
+                decimals=decimals,
+                symbol=symbol,
+                now_ts=now_ts,
+            )
+        except ValueError as exc:
+            return _error_response(400, str(exc))
+        except RuntimeError as exc:
+            logger.exception("Token metadata RPC failure: %s", exc)
+            return _error_response(502, "Failed to validate token metadata via RPC")
+
+        # The checks above ran before the awaits, and the background sweep may have
+        # dropped this creator's list meanwhile: probe the maps again exactly once here
+        # and re-apply the limits that concurrent creates could otherwise overshoot.
+        if len(CUSTOM_PRODUCTS_BY_ID) >= CUSTOM_PRODUCT_MAX_GLOBAL:
+            return _error_response(429, "Global custom product limit reached")
+        creator_products = CUSTOM_PRODUCTS_BY_CREATOR.setdefault(creator_key, [])
+        if len(creator_products) >= CUSTOM_PRODUCT_MAX_PER_CREATOR:
+            return _error_response(429, "Creator active custom product limit reached")
+        CUSTOM_PRODUCTS_BY_ID[product.id] = product
+        heapq.heappush(CUSTOM_PRODUCT_EXPIRY_HEAP, (product.expires_at, product.id))
+        bisect.insort(creator_products, product.id)
+        USED_CREATE_NONCES[nonce_key] = expires_at
+        heapq.heappush(USED_CREATE_NONCE_EXPIRY_HEAP, (expires_at, nonce_key))
 
-    return {
-        "success": True,
-        "product": _catalog_product(request, product),
-    }
+        return {
+            "success": True,
+            "product": _catalog_product(request, product),
+        }
+    finally:
+        CREATE_NONCES_IN_FLIGHT.discard(nonce_key)
 
 
 @app.get("/api/weather")
@@ -1168,20 +1407,13 @@ async def premium_content(request: Request):
 @app.get("/api/custom/{product_id}")
 async def custom_product(product_id: str, request: Request):
     if not CUSTOM_PRODUCTS_ENABLED:
-        return Response(
-            content=json.dumps({"error": "Custom product not found"}),
-            status_code=404,
-            media_type="application/json",
-        )
-    _cleanup_custom_state()
+        return _error_response(404, "Custom product not found")
+    now_ts = int(time.time())
     product = CUSTOM_PRODUCTS_BY_ID.get(product_id)
-    if not product:
-        return Response(
-            content=json.dumps({"error": "Custom product not found"}),
-            status_code=404,
-            media_type="application/json",
-        )
-    return await _handle_paid_product(request, product)
+    # Expired products are removed by the periodic sweep; until then treat them as gone.
+    if not product or product.expires_at <= now_ts:
+        return _error_response(404, "Custom product not found")
+    return await _handle_paid_product(request, product, now_ts)
 
 
 if __name__ == "__main__":
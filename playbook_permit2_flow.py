@@ -17,6 +17,7 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import functools
 import json
 import os
 import re
@@ -30,7 +31,15 @@ from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 import httpx
 from dotenv import load_dotenv
 from eth_account import Account
+from eth_account.datastructures import SignedTransaction
 from web3 import Web3
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+# eth-account renamed rawTransaction to raw_transaction (the old name lingered as a
+# deprecated alias for a release); resolve the field name once.
+_RAW_TX_ATTR = (
+    "raw_transaction" if "raw_transaction" in SignedTransaction._fields else "rawTransaction"
+)
 
 # Load both local and repo multitest env if present.
 load_dotenv()
@@ -80,7 +89,8 @@ FUNDING_CHAIN_ALLOWLIST = {
     if v.strip()
 }
 
-TRANSFER_EVENT_SIG = Web3.keccak(text="Transfer(address,address,uint256)").hex()
+# Compared as raw bytes so HexBytes.hex() prefix differences across versions don't matter.
+TRANSFER_TOPIC = bytes(Web3.keccak(text="Transfer(address,address,uint256)"))
 TX_RE = re.compile(r"0x[a-fA-F0-9]{64}")
 
 ERC20_ABI = [
@@ -144,6 +154,12 @@ class RunResult:
     status: Optional[int]
 
 
+@functools.lru_cache(maxsize=1024)
+def _checksum(address: str) -> str:
+    # EIP-55 is a keccak per call; the playbook re-checksums the same few addresses.
+    return Web3.to_checksum_address(address)
+
+
 def _print_header(title: str) -> None:
     print("\n" + "=" * 72)
     print(title)
@@ -262,10 +278,10 @@ def _child_env() -> dict[str, str]:
 def _decode_transfer_log(log: dict) -> tuple[str, str, int] | None:
     if not log.get("topics") or len(log["topics"]) < 3:
         return None
-    if log["topics"][0].hex() != TRANSFER_EVENT_SIG:
+    if bytes(log["topics"][0]) != TRANSFER_TOPIC:
         return None
-    from_addr = Web3.to_checksum_address("0x" + log["topics"][1].hex()[-40:])
-    to_addr = Web3.to_checksum_address("0x" + log["topics"][2].hex()[-40:])
+    from_addr = _checksum("0x" + bytes(log["topics"][1])[-20:].hex())
+    to_addr = _checksum("0x" + bytes(log["topics"][2])[-20:].hex())
     data = log.get("data")
     if isinstance(data, (bytes, bytearray)):
         amount = int.from_bytes(data, byteorder="big")
@@ -348,7 +364,7 @@ def _check_rpc(w3: Web3) -> int:
 
 
 def _assert_code_exists(w3: Web3, address: str, label: str) -> None:
-    checksum = Web3.to_checksum_address(address)
+    checksum = _checksum(address)
     code = w3.eth.get_code(checksum)
     if not code:
         raise RuntimeError(f"{label} has no deployed code at {checksum}")
@@ -417,12 +433,27 @@ def _stop_process(proc: subprocess.Popen) -> None:
         proc.kill()
 
 
-def _build_fee_params(w3: Web3) -> dict:
-    latest = w3.eth.get_block("latest")
+# Fee hints move slowly on Etherlink; top-up and approve txs sent back to back can
+# share one read instead of a round-trip each.
+FEE_READ_TTL_SECONDS = 5.0
+_fee_read_cache: dict[str, tuple[float, int]] = {}
+
+
+def _cached_fee_read(key: str, fetch) -> int:
+    now = time.monotonic()
+    cached = _fee_read_cache.get(key)
+    if cached and now - cached[0] < FEE_READ_TTL_SECONDS:
+        return cached[1]
+    value = int(fetch())
+    _fee_read_cache[key] = (now, value)
+    return value
+
+
+def _build_fee_params(w3: Web3, latest) -> dict:
     base_fee = latest.get("baseFeePerGas") if isinstance(latest, dict) else None
     if base_fee is not None:
         try:
-            priority = w3.eth.max_priority_fee
+            priority = _cached_fee_read("max_priority_fee", lambda: w3.eth.max_priority_fee)
         except Exception:
             priority = Web3.to_wei(1, "gwei")
         max_fee = int(base_fee) * 2 + int(priority)
@@ -431,24 +462,64 @@ def _build_fee_params(w3: Web3) -> dict:
             "maxFeePerGas": max_fee,
             "maxPriorityFeePerGas": int(priority),
         }
-    return {"gasPrice": w3.eth.gas_price}
+    return {"gasPrice": _cached_fee_read("gas_price", lambda: w3.eth.gas_price)}
+
+
+@functools.lru_cache(maxsize=64)
+def _erc20_contract(w3: Web3, token_address: str):
+    # Contract construction walks the ABI and derives selectors; do it once per token.
+    return w3.eth.contract(address=_checksum(token_address), abi=ERC20_ABI)
+
+
+def _nonce_and_fee_params(
+    w3: Web3, sender: str, estimate_tx: Optional[dict] = None
+) -> tuple[int, dict, Optional[int]]:
+    # Pending nonce, latest block and (optionally) the gas estimate are independent
+    # reads; send them as one JSON-RPC batch where web3 supports it (v7+).
+    gas_est = None
+    if hasattr(w3, "batch_requests"):
+        with w3.batch_requests() as batch:
+            batch.add(w3.eth.get_transaction_count(sender, "pending"))
+            batch.add(w3.eth.get_block("latest"))
+            if estimate_tx is not None:
+                batch.add(w3.eth.estimate_gas(estimate_tx))
+            results = batch.execute()
+        nonce, latest = results[0], results[1]
+        if estimate_tx is not None:
+            gas_est = int(results[2])
+    else:
+        nonce = w3.eth.get_transaction_count(sender, "pending")
+        latest = w3.eth.get_block("latest")
+        if estimate_tx is not None:
+            gas_est = int(w3.eth.estimate_gas(estimate_tx))
+    return int(nonce), _build_fee_params(w3, latest), gas_est
 
 
 def _native_balance(w3: Web3, addr: str) -> int:
-    return int(w3.eth.get_balance(Web3.to_checksum_address(addr)))
+    return int(w3.eth.get_balance(_checksum(addr)))
 
 
 def _erc20_balance(w3: Web3, token_address: str, owner: str) -> int:
-    token = w3.eth.contract(address=Web3.to_checksum_address(token_address), abi=ERC20_ABI)
-    return int(token.functions.balanceOf(Web3.to_checksum_address(owner)).call())
+    token = _erc20_contract(w3, token_address)
+    return int(token.functions.balanceOf(_checksum(owner)).call())
 
 
-def _ensure_native_topup(w3: Web3, to_addr: str, min_balance_wei: int, chain_id: int) -> None:
+def _confirm_tx(w3: Web3, tx_hash, label: str) -> None:
+    receipt = _wait_for_receipt(w3, tx_hash)
+    if receipt.get("status") != 1:
+        raise RuntimeError(f"{label} transaction failed")
+    print(f"{label} tx: {tx_hash.hex()}")
+
+
+def _send_native_topup(
+    w3: Web3, to_addr: str, min_balance_wei: int, chain_id: int
+) -> Optional[tuple[bytes, int]]:
+    """Broadcast a native top-up if needed; returns (tx_hash, nonce) without waiting."""
     if not FUNDING_PRIVATE_KEY:
-        return
+        return None
     if not ALLOW_FUNDING_TOPUPS:
         print("Funding wallet configured, but top-ups are disabled (ALLOW_FUNDING_TOPUPS != 1).")
-        return
+        return None
     if chain_id not in FUNDING_CHAIN_ALLOWLIST:
         raise RuntimeError(
             f"Refusing native top-up on chain {chain_id}; allowed chains={sorted(FUNDING_CHAIN_ALLOWLIST)}"
@@ -456,11 +527,11 @@ def _ensure_native_topup(w3: Web3, to_addr: str, min_balance_wei: int, chain_id:
 
     current = _native_balance(w3, to_addr)
     if current >= int(min_balance_wei):
-        return
+        return None
 
     funder = Account.from_key(FUNDING_PRIVATE_KEY)
-    funder_addr = Web3.to_checksum_address(funder.address)
-    to_addr = Web3.to_checksum_address(to_addr)
+    funder_addr = _checksum(funder.address)
+    to_addr = _checksum(to_addr)
 
     # Conservative fixed top-up.
     topup = int(min_balance_wei) * 5
@@ -469,45 +540,49 @@ def _ensure_native_topup(w3: Web3, to_addr: str, min_balance_wei: int, chain_id:
         f"sending {topup} wei from {funder_addr}"
     )
 
-    nonce = w3.eth.get_transaction_count(funder_addr, "pending")
-    fee_params = _build_fee_params(w3)
+    transfer = {"from": funder_addr, "to": to_addr, "value": topup}
+    nonce, fee_params, gas_est = _nonce_and_fee_params(w3, funder_addr, estimate_tx=transfer)
     tx = {
-        "from": funder_addr,
-        "to": to_addr,
-        "value": topup,
+        **transfer,
         "nonce": nonce,
         "chainId": chain_id,
         **fee_params,
+        "gas": int(gas_est * 12 // 10),
     }
-    gas_est = w3.eth.estimate_gas(tx)
-    tx["gas"] = int(gas_est * 12 // 10)
     signed = w3.eth.account.sign_transaction(tx, private_key=FUNDING_PRIVATE_KEY)
-    raw = getattr(signed, "rawTransaction", None) or getattr(signed, "raw_transaction")
-    tx_hash = w3.eth.send_raw_transaction(raw)
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
-    if receipt.get("status") != 1:
-        raise RuntimeError("native top-up transaction failed")
-    print(f"Native top-up tx: {tx_hash.hex()}")
+    raw = getattr(signed, _RAW_TX_ATTR)
+    return w3.eth.send_raw_transaction(raw), nonce
+
 
+def _send_bbt_topup(
+    w3: Web3,
+    token_address: str,
+    to_addr: str,
+    min_amount: int,
+    chain_id: int,
+    nonce: Optional[int] = None,
+) -> Optional[tuple[bytes, int]]:
+    """Broadcast a BBT top-up if needed; returns (tx_hash, nonce) without waiting.
 
-def _ensure_bbt_topup(w3: Web3, token_address: str, to_addr: str, min_amount: int, chain_id: int) -> None:
+    Pass `nonce` when another funder tx is still pending so both can be in flight.
+    """
     if min_amount <= 0 or not FUNDING_PRIVATE_KEY:
-        return
+        return None
     if not ALLOW_FUNDING_TOPUPS:
         print("Funding wallet configured, but top-ups are disabled (ALLOW_FUNDING_TOPUPS != 1).")
-        return
+        return None
     if chain_id not in FUNDING_CHAIN_ALLOWLIST:
         raise RuntimeError(
             f"Refusing token top-up on chain {chain_id}; allowed chains={sorted(FUNDING_CHAIN_ALLOWLIST)}"
         )
 
-    to_addr = Web3.to_checksum_address(to_addr)
+    to_addr = _checksum(to_addr)
     current = _erc20_balance(w3, token_address, to_addr)
     if current >= int(min_amount):
-        return
+        return None
 
     funder = Account.from_key(FUNDING_PRIVATE_KEY)
-    funder_addr = Web3.to_checksum_address(funder.address)
+    funder_addr = _checksum(funder.address)
 
     funder_bal = _erc20_balance(w3, token_address, funder_addr)
     if funder_bal <= 0:
@@ -523,9 +598,10 @@ def _ensure_bbt_topup(w3: Web3, token_address: str, to_addr: str, min_amount: in
         f"sending {amount} from {funder_addr}"
     )
 
-    token = w3.eth.contract(address=Web3.to_checksum_address(token_address), abi=ERC20_ABI)
-    nonce = w3.eth.get_transaction_count(funder_addr, "pending")
-    fee_params = _build_fee_params(w3)
+    token = _erc20_contract(w3, token_address)
+    pending_nonce, fee_params, _ = _nonce_and_fee_params(w3, funder_addr)
+    if nonce is None:
+        nonce = pending_nonce
     tx = token.functions.transfer(to_addr, amount).build_transaction(
         {
             "from": funder_addr,
@@ -534,15 +610,12 @@ def _ensure_bbt_topup(w3: Web3, token_address: str, to_addr: str, min_amount: in
             **fee_params,
         }
     )
-    gas_est = w3.eth.estimate_gas(tx)
-    tx["gas"] = int(gas_est * 12 // 10)
+    # build_transaction already ran eth_estimateGas to fill "gas"; pad that figure
+    # instead of estimating a second time.
+    tx["gas"] = int(tx["gas"] * 12 // 10)
     signed = w3.eth.account.sign_transaction(tx, private_key=FUNDING_PRIVATE_KEY)
-    raw = getattr(signed, "rawTransaction", None) or getattr(signed, "raw_transaction")
-    tx_hash = w3.eth.send_raw_transaction(raw)
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
-    if receipt.get("status") != 1:
-        raise RuntimeError("BBT top-up transfer failed")
-    print(f"BBT top-up tx: {tx_hash.hex()}")
+    raw = getattr(signed, _RAW_TX_ATTR)
+    return w3.eth.send_raw_transaction(raw), nonce
 
 
 def _ensure_erc20_allowance_to_permit2(
@@ -552,12 +625,9 @@ def _ensure_erc20_allowance_to_permit2(
     required_amount: int,
     chain_id: int,
 ) -> None:
-    token = w3.eth.contract(
-        address=Web3.to_checksum_address(token_address),
-        abi=ERC20_ABI,
-    )
-    owner = Web3.to_checksum_address(account.address)
-    permit2 = Web3.to_checksum_address(PERMIT2_ADDRESS)
+    token = _erc20_contract(w3, token_address)
+    owner = _checksum(account.address)
+    permit2 = _checksum(PERMIT2_ADDRESS)
 
     current = token.functions.allowance(owner, permit2).call()
     print(f"ERC20 allowance(owner->Permit2): {current}")
@@ -566,9 +636,7 @@ def _ensure_erc20_allowance_to_permit2(
         return
 
     print("Approving Permit2 allowance (exact required amount)...")
-    nonce = w3.eth.get_transaction_count(owner, "pending")
-
-    fee_params = _build_fee_params(w3)
+    nonce, fee_params, _ = _nonce_and_fee_params(w3, owner)
     tx = token.functions.approve(permit2, int(required_amount)).build_transaction(
         {
             "from": owner,
@@ -577,20 +645,34 @@ def _ensure_erc20_allowance_to_permit2(
             **fee_params,
         }
     )
-    gas_est = w3.eth.estimate_gas(tx)
-    tx["gas"] = int(gas_est * 12 // 10)
+    tx["gas"] = int(tx["gas"] * 12 // 10)
 
     signed = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
-    raw = getattr(signed, "rawTransaction", None) or getattr(signed, "raw_transaction")
+    raw = getattr(signed, _RAW_TX_ATTR)
     tx_hash = w3.eth.send_raw_transaction(raw)
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
+    receipt = _wait_for_receipt(w3, tx_hash)
     if receipt.get("status") != 1:
         raise RuntimeError("approve() transaction failed")
     print(f"Approve tx: {tx_hash.hex()} (amount={required_amount})")
 
 
+def _wait_for_receipt(w3: Web3, tx_hash, timeout: float = 180.0):
+    # Back off from 0.1s to 1s between polls instead of web3's fixed 0.1s: Etherlink
+    # blocks take around a second, so tight polling mostly burns RPC requests.
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while True:
+        try:
+            return w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            if time.monotonic() >= deadline:
+                raise TimeExhausted(f"transaction {tx_hash} not mined within {timeout}s")
+        time.sleep(delay)
+        delay = min(delay * 1.5, 1.0)
+
+
 def _get_transfer_receipt(w3: Web3, tx_hash: str) -> dict:
-    return w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
+    return _wait_for_receipt(w3, tx_hash)
 
 
 def _analyze_transfer(w3: Web3, tx_hash: str, token_address: str) -> RunResult:
@@ -602,9 +684,10 @@ def _analyze_transfer(w3: Web3, tx_hash: str, token_address: str) -> RunResult:
     transfer_to = None
     transfer_amount = None
 
-    token_address = Web3.to_checksum_address(token_address)
+    token_address_lower = token_address.lower()
     for log in receipt.get("logs", []):
-        if (log.get("address") or "").lower() != token_address.lower():
+        # Cheap address filter first; only the token's own logs get topic-decoded.
+        if (log.get("address") or "").lower() != token_address_lower:
             continue
         decoded = _decode_transfer_log(log)
         if decoded:
@@ -710,8 +793,8 @@ async def main() -> int:
         accept = (payment_required.get("accepts") or [])[0]
         asset = accept["asset"]
         amount = int(accept.get("amount") or accept.get("maxAmountRequired"))
-        pay_to = Web3.to_checksum_address(accept["payTo"])
-        token_address = Web3.to_checksum_address(asset)
+        pay_to = _checksum(accept["payTo"])
+        token_address = _checksum(asset)
     except Exception as exc:
         print(f"ERROR: could not parse Payment-Required: {exc}")
         if server_started and server_proc:
@@ -725,23 +808,43 @@ async def main() -> int:
     print(f"payTo: {pay_to}")
 
     _print_header("BALANCES (PRE)")
-    client_native = _native_balance(w3, account.address)
-    client_bbt = _erc20_balance(w3, token_address, account.address)
-    print(f"Client native balance: {client_native} wei")
-    print(f"Client BBT balance: {client_bbt}")
+    # Independent blocking RPC reads: run them in worker threads so they overlap.
+    balance_reads = [
+        asyncio.to_thread(_native_balance, w3, account.address),
+        asyncio.to_thread(_erc20_balance, w3, token_address, account.address),
+    ]
     if FUNDING_PRIVATE_KEY:
         funder = Account.from_key(FUNDING_PRIVATE_KEY)
-        funder_native = _native_balance(w3, funder.address)
-        funder_bbt = _erc20_balance(w3, token_address, funder.address)
-        print(f"Funder native balance: {funder_native} wei")
-        print(f"Funder BBT balance: {funder_bbt}")
+        balance_reads += [
+            asyncio.to_thread(_native_balance, w3, funder.address),
+            asyncio.to_thread(_erc20_balance, w3, token_address, funder.address),
+        ]
+    balances = await asyncio.gather(*balance_reads)
+    print(f"Client native balance: {balances[0]} wei")
+    print(f"Client BBT balance: {balances[1]}")
+    if FUNDING_PRIVATE_KEY:
+        print(f"Funder native balance: {balances[2]} wei")
+        print(f"Funder BBT balance: {balances[3]}")
 
     # For Permit2 SignatureTransfer, the client still needs gas at least once to approve Permit2,
     # and needs token balance to cover the payment.
-    _ensure_native_topup(w3, account.address, MIN_NATIVE_BALANCE_WEI, tx_chain_id)
-    _ensure_bbt_topup(
-        w3, token_address, account.address, max(amount, MIN_BBT_BALANCE), tx_chain_id
+    # Both top-ups come from the funding wallet: broadcast them back to back with
+    # consecutive nonces, then wait for the receipts together.
+    native_topup = _send_native_topup(w3, account.address, MIN_NATIVE_BALANCE_WEI, tx_chain_id)
+    bbt_topup = _send_bbt_topup(
+        w3,
+        token_address,
+        account.address,
+        max(amount, MIN_BBT_BALANCE),
+        tx_chain_id,
+        nonce=native_topup[1] + 1 if native_topup else None,
     )
+    confirmations = []
+    if native_topup:
+        confirmations.append(asyncio.to_thread(_confirm_tx, w3, native_topup[0], "Native top-up"))
+    if bbt_topup:
+        confirmations.append(asyncio.to_thread(_confirm_tx, w3, bbt_topup[0], "BBT top-up"))
+    await asyncio.gather(*confirmations)
 
     _print_header("ALLOWANCE")
     _ensure_erc20_allowance_to_permit2(w3, account, token_address, amount, tx_chain_id)
@@ -758,7 +861,7 @@ async def main() -> int:
 
     _assert_client_payload_invariants(
         output=output,
-        expected_spender=Web3.to_checksum_address(X402_EXACT_PERMIT2_PROXY_ADDRESS),
+        expected_spender=_checksum(X402_EXACT_PERMIT2_PROXY_ADDRESS),
         expected_to=pay_to,
         expected_amount=amount,
     )
@@ -778,7 +881,7 @@ async def main() -> int:
     print(f"Transfer status: {result.status}")
     print(f"Block: {result.block_number}")
 
-    expected_from = Web3.to_checksum_address(account.address)
+    expected_from = account.address
     expected_to = pay_to
     expected_amount = amount
 
@@ -0,0 +1,13 @@
+import os
+import sys
+from pathlib import Path
+
+# bbt_mvp_server reads its config at import time; pin a hermetic environment first.
+os.environ["SKIP_DOTENV"] = "1"
+os.environ["SERVER_WALLET"] = "0x000000000022D473030F116dDEE9F6B43aC78BA3"
+os.environ["FACILITATOR_URL"] = "http://facilitator.test"
+os.environ["RPC_URL"] = "http://rpc.test"
+os.environ["CUSTOM_PRODUCTS_ENABLED"] = "true"
+os.environ.pop("PUBLIC_BASE_URL", None)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,402 @@
+import asyncio
+import base64
+import json
+import time
+import uuid
+
+import httpx
+import pytest
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+import bbt_mvp_server as server
+
+TX_HASH = "0x" + "ab" * 32
+PAYER = Account.create()
+CREATOR = Account.create()
+CUSTOM_TOKEN = server._to_checksum("0x" + "12" * 20, "token")
+
+
+def _abi_string(value: str) -> str:
+    data = value.encode()
+    return "0x" + (
+        (32).to_bytes(32, "big") + len(data).to_bytes(32, "big") + data.ljust(32, b"\0")
+    ).hex()
+
+
+def _rpc_result(call: dict) -> dict:
+    if call["method"] == "eth_getCode":
+        result = "0x6080"
+    elif call["params"][0]["data"] == "0x313ce567":  # decimals()
+        result = "0x" + (18).to_bytes(32, "big").hex()
+    else:  # symbol()
+        result = _abi_string("TST")
+    return {"jsonrpc": "2.0", "id": call["id"], "result": result}
+
+
+def _upstream(request: httpx.Request) -> httpx.Response:
+    if request.url.host == "facilitator.test":
+        return httpx.Response(200, json={"success": True, "transaction": TX_HASH})
+    calls = json.loads(request.content)
+    return httpx.Response(200, json=[_rpc_result(call) for call in calls])
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(
+        server, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(_upstream))
+    )
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+def _payment_header(
+    amount: str,
+    signature: str = "0x" + "11" * 65,
+    owner: str = PAYER.address,
+    token: str | None = None,
+) -> str:
+    requirements = server.PRODUCTS["weather"].requirements
+    payload = {
+        "x402Version": 2,
+        "accepted": requirements,
+        "payload": {
+            "signature": signature,
+            "permit2Authorization": {
+                "from": owner,
+                "spender": server.X402_EXACT_PERMIT2_PROXY_ADDRESS,
+                "permitted": {"token": token or requirements["asset"], "amount": amount},
+                "nonce": str(uuid.uuid4().int),
+                "deadline": str(int(time.time()) + 30),
+                "witness": {"to": requirements["payTo"], "validAfter": "0", "extra": "0x"},
+            },
+        },
+    }
+    return base64.b64encode(json.dumps(payload).encode()).decode()
+
+
+def _create_request(nonce: str) -> dict:
+    issued_at = int(time.time())
+    fields = {
+        "chain_id": server.CHAIN_ID,
+        "creator": CREATOR.address,
+        "token": CUSTOM_TOKEN,
+        "tier_id": "tier_0_01",
+        "nonce": nonce,
+        "issued_at": issued_at,
+        "expires_at": issued_at + 120,
+    }
+    message = server._custom_create_message(**fields)
+    signed = Account.sign_message(encode_defunct(primitive=message), CREATOR.key)
+    return {
+        "creator": fields["creator"],
+        "token": fields["token"],
+        "tierId": fields["tier_id"],
+        "nonce": nonce,
+        "issuedAt": issued_at,
+        "expiresAt": fields["expires_at"],
+        "chainId": fields["chain_id"],
+        "signature": "0x" + signed.signature.hex().removeprefix("0x"),
+    }
+
+
+def test_probe_without_payment_returns_402_with_requirements(client):
+    resp = client.get("/api/weather")
+
+    assert resp.status_code == 402
+    required = json.loads(base64.b64decode(resp.headers["Payment-Required"]))
+    assert required["accepts"][0]["amount"] == server.PRODUCTS["weather"].requirements["amount"]
+
+
+def test_paid_request_settles_via_facilitator(client):
+    amount = server.PRODUCTS["weather"].requirements["amount"]
+    resp = client.get("/api/weather", headers={"Payment-Signature": _payment_header(amount)})
+
+    assert resp.status_code == 200
+    assert resp.json()["txHash"] == TX_HASH
+    settlement = json.loads(base64.b64decode(resp.headers["X-Payment-Response"]))
+    assert settlement["success"] is True
+
+
+def test_amount_mismatch_is_rejected(client):
+    resp = client.get("/api/weather", headers={"Payment-Signature": _payment_header("1")})
+
+    assert resp.status_code == 402
+    assert resp.json() == {"error": "Payment amount mismatch"}
+
+
+def test_custom_create_rejects_duplicate_nonce(client):
+    payload = _create_request(nonce=uuid.uuid4().hex)
+
+    first = client.post("/api/catalog/custom-token", json=payload)
+    second = client.post("/api/catalog/custom-token", json=payload)
+
+    assert first.status_code == 200, first.text
+    assert first.json()["product"]["payment"]["asset"] == CUSTOM_TOKEN
+    assert second.status_code == 400
+    assert second.json() == {"error": "Nonce already used for creator"}
+
+
+def _request_from(forwarded_for: str) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "headers": [(b"x-forwarded-for", forwarded_for.encode())],
+            "client": ("127.0.0.1", 1),
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    ("forwarded_for", "same_as"),
+    [
+        ("1.2.3.4:5678", "1.2.3.4"),
+        ("[2001:db8::1]:443", "2001:db8::1"),
+        ("::ffff:1.2.3.4", "1.2.3.4"),
+    ],
+)
+def test_client_ip_key_strips_ports_and_folds_ipv4(forwarded_for, same_as):
+    assert server._client_ip_key(_request_from(forwarded_for)) == server._client_ip_key(
+        _request_from(same_as)
+    )
+
+
+def test_client_ip_key_keeps_unparseable_values_apart():
+    keys = {
+        server._client_ip_key(_request_from(value))
+        for value in ("unknown", "junk-a", "junk-b", "1.2.3.4", "9.9.9.9:1")
+    }
+    assert len(keys) == 5
+
+
+def test_restarted_app_gets_a_fresh_http_client():
+    with TestClient(server.app):
+        pass
+    assert server.http_client.is_closed
+
+    with TestClient(server.app):
+        assert not server.http_client.is_closed
+
+
+def test_custom_create_reports_concurrent_nonce_as_in_progress(client):
+    payload = _create_request(nonce=uuid.uuid4().hex)
+    nonce_key = (server._address_key(CREATOR.address), payload["nonce"])
+    server.CREATE_NONCES_IN_FLIGHT.add(nonce_key)
+    try:
+        resp = client.post("/api/catalog/custom-token", json=payload)
+    finally:
+        server.CREATE_NONCES_IN_FLIGHT.discard(nonce_key)
+
+    assert resp.status_code == 409
+    assert resp.json() == {"error": "Create already in progress for this nonce"}
+
+
+@pytest.mark.parametrize("signature", ["0x11 22", "0x123", "0x", "11" * 65])
+def test_malformed_permit2_signature_is_rejected(client, signature):
+    amount = server.PRODUCTS["weather"].requirements["amount"]
+    resp = client.get(
+        "/api/weather", headers={"Payment-Signature": _payment_header(amount, signature=signature)}
+    )
+
+    assert resp.status_code == 400
+    assert resp.json() == {"error": "Invalid signature in permit2 payload"}
+
+
+def test_mismatched_accepted_requirements_echo_both_sides(client):
+    amount = server.PRODUCTS["weather"].requirements["amount"]
+    payment = json.loads(base64.b64decode(_payment_header(amount)))
+    payment["accepted"] = {**payment["accepted"], "payTo": CREATOR.address}
+    header = base64.b64encode(json.dumps(payment).encode()).decode()
+
+    resp = client.get("/api/weather", headers={"Payment-Signature": header})
+
+    assert resp.status_code == 402
+    assert resp.headers["content-type"] == "application/json"
+    body = resp.json()
+    assert body["error"] == "Accepted requirements do not match offered requirements"
+    assert body["accepted"]["payTo"] == CREATOR.address
+
+
+def test_facilitator_failure_echoes_large_integers_exactly(client, monkeypatch):
+    big = 2**255 + 1
+
+    def failing_facilitator(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(400, content=json.dumps({"reason": "rejected", "amount": big}))
+
+    monkeypatch.setattr(
+        server,
+        "http_client",
+        httpx.AsyncClient(transport=httpx.MockTransport(failing_facilitator)),
+    )
+    amount = server.PRODUCTS["weather"].requirements["amount"]
+    resp = client.get("/api/weather", headers={"Payment-Signature": _payment_header(amount)})
+
+    assert resp.status_code == 402
+    assert json.loads(resp.content)["facilitator_response"]["amount"] == big
+
+
+def test_small_catalog_is_not_gzipped(client):
+    resp = client.get("/api/catalog", headers={"Accept-Encoding": "gzip"})
+
+    assert len(resp.content) < server.CATALOG_GZIP_MIN_BYTES
+    assert "content-encoding" not in resp.headers
+
+
+@pytest.fixture
+def gzip_catalog(client, monkeypatch):
+    monkeypatch.setattr(server, "CATALOG_GZIP_MIN_BYTES", 0)
+    server.CATALOG_RESPONSE_CACHE.clear()
+    yield client
+    server.CATALOG_RESPONSE_CACHE.clear()
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "gzipped"),
+    [
+        ("gzip", True),
+        ("br, gzip;q=0.5", True),
+        ("*", True),
+        ("gzip;q=0", False),
+        ("gzip;q=0, *", False),
+        ("*;q=0", False),
+        ("identity", False),
+    ],
+)
+def test_catalog_gzip_honors_q_values(gzip_catalog, accept_encoding, gzipped):
+    resp = gzip_catalog.get("/api/catalog", headers={"Accept-Encoding": accept_encoding})
+
+    assert resp.status_code == 200
+    assert (resp.headers.get("content-encoding") == "gzip") is gzipped
+    assert resp.headers["etag"].endswith('-gzip"') is gzipped
+    assert resp.json()["products"]
+
+
+def test_catalog_304_carries_only_etag_and_vary(gzip_catalog):
+    etag = gzip_catalog.get("/api/catalog", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+
+    resp = gzip_catalog.get(
+        "/api/catalog", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+
+    assert resp.status_code == 304
+    assert resp.headers["etag"] == etag
+    assert resp.headers["vary"] == "Accept-Encoding"
+    assert "content-encoding" not in resp.headers
+
+
+@pytest.mark.parametrize("prefix", ["0x", "0X", ""])
+def test_checksum_accepts_optional_prefix(prefix):
+    address = Account.create().address
+
+    assert server._to_checksum(prefix + address[2:].lower(), "address") == address
+
+
+def test_paid_request_accepts_unprefixed_and_uppercase_prefixed_addresses(client):
+    amount = server.PRODUCTS["weather"].requirements["amount"]
+    header = _payment_header(
+        amount,
+        owner="0X" + PAYER.address[2:],
+        token=server.BBT_TOKEN[2:].lower(),
+    )
+
+    resp = client.get("/api/weather", headers={"Payment-Signature": header})
+
+    assert resp.status_code == 200, resp.text
+
+
+@pytest.mark.parametrize(
+    ("overrides", "error"),
+    [
+        ({"creator": 1, "tierId": "nope", "nonce": 5}, "Invalid tierId"),
+        ({"nonce": 5, "chainId": "x", "creator": 1}, "Invalid nonce"),
+        ({"nonce": "   "}, "Invalid nonce"),
+        ({"signature": 7, "chainId": "x"}, "Invalid signature"),
+        ({"chainId": "x", "creator": 1}, "Invalid chainId/issuedAt/expiresAt"),
+        ({"creator": 1, "token": 2}, "Invalid creator: must be a string"),
+        ({"token": 2}, "Invalid token: must be a string"),
+    ],
+)
+def test_custom_create_validation_errors_follow_field_order(client, overrides, error):
+    payload = {**_create_request(nonce=uuid.uuid4().hex), **overrides}
+
+    resp = client.post("/api/catalog/custom-token", json=payload)
+
+    assert resp.status_code == 400
+    assert resp.json() == {"error": error}
+
+
+def test_custom_create_rejects_non_object_payload(client):
+    resp = client.post("/api/catalog/custom-token", json=[1])
+
+    assert resp.status_code == 400
+    assert resp.json() == {"error": "Invalid payload format"}
+
+
+def test_custom_create_rejects_oversized_body(client):
+    resp = client.post(
+        "/api/catalog/custom-token",
+        content=b" " * (server.CUSTOM_CREATE_MAX_BODY_BYTES + 1),
+        headers={"Content-Type": "application/json"},
+    )
+
+    assert resp.status_code == 413
+
+
+def test_custom_create_is_rate_limited_per_ip(client, monkeypatch):
+    monkeypatch.setattr(server, "CUSTOM_PRODUCT_CREATE_MAX_PER_IP_PER_HOUR", 2)
+    headers = {"X-Forwarded-For": "198.51.100.7"}
+
+    statuses = [
+        client.post("/api/catalog/custom-token", json={}, headers=headers).status_code
+        for _ in range(3)
+    ]
+    other_ip = client.post(
+        "/api/catalog/custom-token", json={}, headers={"X-Forwarded-For": "198.51.100.8"}
+    )
+
+    assert statuses == [400, 400, 429]
+    assert other_ip.status_code == 400
+
+
+def test_expired_custom_product_is_not_served(client):
+    created = client.post("/api/catalog/custom-token", json=_create_request(uuid.uuid4().hex))
+    product_id = created.json()["product"]["id"]
+
+    assert client.get(f"/api/custom/{product_id}").status_code == 402
+
+    server.CUSTOM_PRODUCTS_BY_ID[product_id].expires_at = int(time.time()) - 1
+    resp = client.get(f"/api/custom/{product_id}")
+
+    assert resp.status_code == 404
+    assert resp.json() == {"error": "Custom product not found"}
+
+
+def test_token_metadata_lock_survives_a_failed_fetch(monkeypatch):
+    token = Account.create().address
+    fetches = []
+
+    async def fetch(_token):
+        fetches.append(_token)
+        await asyncio.sleep(0.05)
+        if len(fetches) == 1:
+            raise RuntimeError("rpc down")
+        return 18, "TST"
+
+    monkeypatch.setattr(server, "_fetch_token_metadata", fetch)
+
+    async def scenario():
+        first = asyncio.create_task(server._resolve_token_metadata(token))
+        queued = asyncio.create_task(server._resolve_token_metadata(token))
+        with pytest.raises(RuntimeError):
+            await first
+        # `queued` now holds the lock and is fetching; a new caller must wait on the
+        # same lock instead of starting a third fetch.
+        late = await server._resolve_token_metadata(token)
+        return late, await queued
+
+    assert asyncio.run(scenario()) == ((18, "TST"), (18, "TST"))
+    assert len(fetches) == 2
+    assert token not in server.TOKEN_METADATA_LOCKS
+    assert token not in server.TOKEN_METADATA_LOCK_USERS